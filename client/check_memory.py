@@ -0,0 +1,67 @@
+import sys
+import asyncio
+
+from memory import ConversationMemory, ContextBudgetError
+
+# TERMINAL
+# For instance: python.exe check_memory.py
+# Exits with 1 when the conversation memory folds the current turn, cuts the pinned messages or sends more than its token budget
+
+async def summarize(summary, transcript) -> str:
+    return "S"
+
+def play(memory, turns):
+    for turn in range(turns):
+        memory.add({"role": "user", "content": f"Player line {turn}"})
+        memory.add({"role": "assistant", "content": f"Game Master answer {turn}"})
+
+async def check_keep_turns_zero() -> list[str]:
+    memory = ConversationMemory(budget_tokens=12000, keep_turns=0)
+    memory.pin([{"role": "system", "content": "init"}])
+    errors = []
+    for turn in range(3):
+        memory.add({"role": "user", "content": f"Player line {turn}"})
+        await memory.fit(summarize)
+        contents = [message["content"] for message in memory.messages()]
+        if contents[-1] != f"Player line {turn}":
+            errors.append(f"keep_turns=0, turn {turn}: the current player line isn't sent, the messages are {contents}")
+        memory.add({"role": "assistant", "content": f"Game Master answer {turn}"})
+    return errors
+
+async def long_summary(summary, transcript) -> str:
+    return "A long summary of the game so far. " * 20
+
+async def check_summary_over_budget() -> list[str]:
+    pinned = [{"role": "system", "content": "The initial prompt " * 10}, {"role": "system", "content": "The world index " * 10}]
+    memory = ConversationMemory(budget_tokens=150, keep_turns=2)
+    memory.pin(pinned)
+    play(memory, 4)
+    memory.add({"role": "user", "content": "The current line"})
+    await memory.fit(long_summary)
+    errors = []
+    if memory.estimate_tokens() > memory.budget_tokens:
+        errors.append(f"Summary over budget: {memory.estimate_tokens()} tokens sent, the budget is {memory.budget_tokens}")
+    if memory.messages()[:len(pinned)] != pinned:
+        errors.append("Summary over budget: the pinned messages were changed")
+    if memory.messages()[-1]["content"] != "The current line":
+        errors.append("Summary over budget: the current player line isn't sent")
+    return errors
+
+def check_pinned_over_budget() -> list[str]:
+    memory = ConversationMemory(budget_tokens=30, keep_turns=2)
+    try:
+        memory.pin([{"role": "system", "content": "The initial prompt " * 10}])
+    except ContextBudgetError:
+        return []
+    return ["Pinned over budget: pinning more than the budget didn't raise ContextBudgetError"]
+
+async def check_memory() -> list[str]:
+    return await check_keep_turns_zero() + await check_summary_over_budget() + check_pinned_over_budget()
+
+if __name__ == "__main__":
+    errors = asyncio.run(check_memory())
+    for error in errors:
+        print(error)
+    if errors:
+        sys.exit(1)
+    print("The conversation memory kept the current turn and the pinned messages and stayed within its budget.")
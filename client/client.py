@@ -3,10 +3,24 @@ import os
 import argparse
 import asyncio
 import json
+import sys
+import time
+import queue
+import atexit
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 from fastmcp import Client
 
+from memory import ConversationMemory, ContextBudgetError, estimate_tokens
+from tool_cache import ToolResultCache
+
+
+# The world resources read from the MCP server, cached between the runs of the client
+WORLD_RESOURCES_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".world_resources_cache.json")
+
 
 class Colors:
     """String literals of ANSI escape codes for simple colors"""
@@ -33,6 +47,68 @@ class Colors:
     BG_WHITE = '\033[47m'
 
 
+logger = logging.getLogger("rpg_client") # Set up in main, see setup_logging
+
+
+class ConsoleFormatter(logging.Formatter):
+    """The verbose lines on stdout, black on white so they stand out from the game"""
+    def format(self, record) -> str:
+        return f"{Colors.BG_WHITE}{Colors.BLACK}{record.getMessage()}{Colors.RESET}"
+
+
+class JsonFormatter(logging.Formatter):
+    """The log file lines, one JSON object per line: time, level, message and the record's structured fields"""
+    def format(self, record) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(verbose, log_file=None, max_bytes=10 * 1024 * 1024, backups=5):
+    # The log calls only put the records on a queue, a background thread writes them out, so the logging doesn't slow down the game
+    handlers = []
+    if verbose:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(ConsoleFormatter())
+        handlers.append(console_handler)
+    if log_file:
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.setLevel(logging.INFO if handlers else logging.WARNING)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+class TurnStats:
+    """Where the time and the tokens of one game turn went"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.llm_seconds = 0.0
+        self.llm_requests = 0
+        self.tool_seconds = [] # (tool, seconds) of every tool call
+        self.tool_rounds = 0
+        self.context_tokens = 0 # Local estimate of the last request's context
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def summary(self) -> str:
+        tools = ", ".join(f"{tool} {seconds * 1000:.0f} ms" for tool, seconds in self.tool_seconds) or "none"
+        return (f"Turn took {time.perf_counter() - self.start:.2f} s - LLM: {self.llm_seconds:.2f} s in {self.llm_requests} request(s), "
+                f"tools ({self.tool_rounds} round(s)): {tools}, tokens in: {self.tokens_in}, tokens out: {self.tokens_out}, "
+                f"context: ~{self.context_tokens} tokens")
+
+
 class CliRpg(patched_cmd.Cmd):
     prompt = f"{Colors.BOLD}{Colors.GREEN}menu){Colors.RESET} "
     intro = f"{Colors.BOLD}Welcome to the CLI RPG game.{Colors.RESET}\nType {Colors.BOLD}\"play\"{Colors.RESET} to start playing.\nType {Colors.BOLD}\"help\"{Colors.RESET} for available commands."
@@ -45,8 +121,15 @@ class CliRpg(patched_cmd.Cmd):
     mcp_client = None
     api_key = None
     openai = None
-    messages = []
+    memory = None # ConversationMemory, the messages sent to the LLM
+    tool_cache = None # ToolResultCache, the results of the read only tool calls
     available_tools = []
+    read_only_tools = set() # The tools annotated as read only by the server, their calls can run concurrently
+    model = "gpt-4.1-nano" # The LLM of the game master and of the summaries (--model)
+    max_tool_rounds = 5 # Model responses with tool calls per turn, then the model must answer
+    turn_budget = 60.0 # Seconds per turn, then the model must answer
+    summary_tokens = 300 # Max length of the running summary of the old turns
+    world_index_rows = 50 # Max locations and max items listed in the world index given to the LLM
     initial_prompts = None
 
 
@@ -65,11 +148,13 @@ class CliRpg(patched_cmd.Cmd):
         else:
             raise Exception("The game client can't function properly without an active connection to the MCP server!")
 
+        self.memory = ConversationMemory()
+        self.tool_cache = ToolResultCache()
+
 
-    def log(self, *args):
-        if self.verbose:
-            printable_line = " ".join(str(arg) for arg in args)
-            print(f"{Colors.BG_WHITE}{Colors.BLACK}{printable_line}{Colors.RESET}")
+    def log(self, *args, level=logging.INFO, **fields):
+        if logger.isEnabledFor(level):
+            logger.log(level, " ".join(str(arg) for arg in args), extra={"fields": fields})
     
 
     def do_exit(self, line):
@@ -78,10 +163,10 @@ class CliRpg(patched_cmd.Cmd):
         if not self.in_game:
             return True # Exit the program
 
-        self.log(self.messages)
+        self.log(self.memory.messages())
 
-        if self.messages:
-            self.messages.clear()
+        self.memory.clear()
+        self.tool_cache.clear()
 
         self.in_game = False
         self.prompt = f"{Colors.BOLD}{Colors.GREEN}menu){Colors.RESET} "
@@ -93,58 +178,205 @@ class CliRpg(patched_cmd.Cmd):
         a = 1 # Needs to do something I think, otherwise a weird bug with async / await happens
 
 
-    async def process_game_line(self, line, recursive = False):
-        # Wrapper function for all things that need doing when the player makes an action or "something" in regards to the game
-
-        # Recursive calls to this function happen when the LLM wants to call a tool on the MCP server, so the line argument is empty thus it shouldn't be put into the message history
-        if not recursive:
-            self.messages.append({
-                "role": "user",
-                "content": line
-            })
-
-        response = self.openai.chat.completions.create(
-            model = "gpt-4.1-nano",
+    async def stream_completion(self, stats, tool_choice = "auto"):
+        # Streams the LLM's reply - the Game Master's text is printed as it arrives, the tool calls are assembled from their deltas
+        # Returns the assistant message (as sent back to the LLM) and the finish reason, the time and tokens go to the stats
+        start = time.perf_counter()
+        first_token_time = None
+        stream = await self.openai.chat.completions.create(
+            model = self.model,
             max_tokens = 100,
-            messages = self.messages,
+            messages = self.memory.messages(),
             tools = self.available_tools,
+            tool_choice = tool_choice,
             temperature = 0.2,
             user = "TTRPG Player",
+            stream = True,
+            stream_options = {"include_usage": True},
         )
 
-        for choice in response.choices:
-            if choice.finish_reason == "tool_calls":
-                self.messages.append(choice.message)
-                
-                for tool_call in choice.message.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
-
-                    self.log(f"\nThe LLM wanted to call the {tool_name} tool with args {tool_args}...")
-                    result = await self.mcp_client.call_tool(tool_name, tool_args)
-                    self.log(f"\nTool response: {result}")
-                    self.messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": result.content,
-                        }
-                    )
-                
-                await self.process_game_line("", True)
-
-            # elif choice.finish_reason == "stop":
-            else:
-                self.messages.append({
-                    "role": "assistant",
-                    "content": choice.message.content
+        content = []
+        tool_calls = {} # index -> the tool call, its arguments come in pieces
+        finish_reason = None
+        pending_newlines = "" # The trailing new lines are held back, so the reply doesn't end with an empty line
+        async for chunk in stream:
+            if chunk.usage:
+                stats.tokens_in += chunk.usage.prompt_tokens
+                stats.tokens_out += chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+
+            if first_token_time is None and (delta.content or delta.tool_calls):
+                first_token_time = time.perf_counter()
+
+            if delta.content:
+                if not content:
+                    print(f"{Colors.BLUE}{Colors.BOLD}Game Master) {Colors.RESET}{Colors.BLUE}", end = '', flush = True)
+                content.append(delta.content)
+                text = pending_newlines + delta.content
+                stripped = text.rstrip('\n')
+                pending_newlines = text[len(stripped):]
+                print(stripped, end = '', flush = True)
+
+            for tool_call_delta in delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(tool_call_delta.index, {
+                    "id": None,
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
                 })
-                
-                msg = choice.message.content
-                if msg.endswith('\n'):
-                    msg = msg[:-1]
-
-                print(f"{Colors.BLUE}{Colors.BOLD}Game Master) {Colors.RESET}{Colors.BLUE}{msg}{Colors.RESET}")
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    if tool_call_delta.function.name:
+                        tool_call["function"]["name"] += tool_call_delta.function.name
+                    if tool_call_delta.function.arguments:
+                        tool_call["function"]["arguments"] += tool_call_delta.function.arguments
+
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+
+        if content:
+            print(Colors.RESET)
+
+        end = time.perf_counter()
+        stats.llm_seconds += end - start
+        stats.llm_requests += 1
+        time_to_first_token = (first_token_time or end) - start
+        self.log(f"LLM reply streamed, first token after {time_to_first_token * 1000:.0f} ms, completed after {(end - start) * 1000:.0f} ms",
+                 event="llm_completion", time_to_first_token_ms=round(time_to_first_token * 1000), duration_ms=round((end - start) * 1000),
+                 finish_reason=finish_reason)
+
+        message = {
+            "role": "assistant",
+            "content": "".join(content) or None,
+        }
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+        return message, finish_reason
+
+
+    async def process_game_line(self, line):
+        # Wrapper function for all things that need doing when the player makes an action or "something" in regards to the game
+        self.memory.add({
+            "role": "user",
+            "content": line
+        })
+
+        # The model can ask for tools up to max_tool_rounds times (and until the turn's time budget runs out), then it has to answer
+        stats = TurnStats()
+        deadline = stats.start + self.turn_budget
+        while True:
+            # The old turns are folded into the summary when the context would go over its token budget
+            tools_tokens = estimate_tokens(self.available_tools)
+            await self.memory.fit(lambda summary, transcript: self.summarize(summary, transcript, stats), tools_tokens)
+            stats.context_tokens = tools_tokens + self.memory.estimate_tokens()
+            can_call_tools = stats.tool_rounds < self.max_tool_rounds and time.perf_counter() < deadline
+            message, finish_reason = await self.stream_completion(stats, "auto" if can_call_tools else "none")
+
+            if finish_reason == "tool_calls" and can_call_tools:
+                self.memory.add(message)
+                for result in await self.call_tools(message["tool_calls"], stats):
+                    self.memory.add(result)
+                stats.tool_rounds += 1
+                continue
+
+            if finish_reason == "tool_calls":
+                self.log(f"The LLM asked for tools after the turn's limit ({self.max_tool_rounds} rounds, {self.turn_budget} s), the calls were dropped",
+                         level=logging.WARNING, event="tool_limit_exceeded")
+                print(f"{Colors.YELLOW}The Game Master got lost in thought, please try again.{Colors.RESET}")
+            # elif finish_reason == "stop":
+            self.memory.add({
+                "role": "assistant",
+                "content": message["content"] or ""
+            })
+            break
+
+        self.log(f"{stats.summary()}, tool cache hit rate: {self.tool_cache.hit_rate():.0%}", event="turn", duration_ms=round((time.perf_counter() - stats.start) * 1000),
+                 llm_ms=round(stats.llm_seconds * 1000), llm_requests=stats.llm_requests, tool_rounds=stats.tool_rounds,
+                 tool_ms=[(tool, round(seconds * 1000)) for tool, seconds in stats.tool_seconds],
+                 tokens_in=stats.tokens_in, tokens_out=stats.tokens_out, context_tokens=stats.context_tokens,
+                 tool_cache_hits=self.tool_cache.hits, tool_cache_misses=self.tool_cache.misses)
+
+
+    async def summarize(self, summary, transcript, stats):
+        # The running summary of the old turns, rewritten by the LLM with the turns that leave the context
+        start = time.perf_counter()
+        response = await self.openai.chat.completions.create(
+            model = self.model,
+            max_tokens = self.summary_tokens,
+            messages = [
+                {
+                    "role": "system",
+                    "content": "You keep the notes of a TTRPG game master. Update the summary of the game with the new turns. "
+                               "Keep the facts that matter later: the character, where they are, quests, items, defeated enemies, "
+                               "promises and decisions. Be brief, answer with the summary only."
+                },
+                {
+                    "role": "user",
+                    "content": f"Summary so far: {summary or '(none)'}\n\nNew turns:\n{transcript}"
+                },
+            ],
+            temperature = 0.2,
+            user = "TTRPG Player",
+        )
+        stats.llm_seconds += time.perf_counter() - start
+        stats.llm_requests += 1
+        if response.usage:
+            stats.tokens_in += response.usage.prompt_tokens
+            stats.tokens_out += response.usage.completion_tokens
+        self.log(f"Old turns folded into the summary: {response.choices[0].message.content}", event="summary")
+        return response.choices[0].message.content or summary
+
+
+    async def call_tool(self, tool_call, stats = None):
+        tool_name = tool_call["function"]["name"]
+        tool_args = json.loads(tool_call["function"]["arguments"] or "{}")
+
+        self.log(f"\nThe LLM wanted to call the {tool_name} tool with args {tool_args}...", event="tool_call", tool=tool_name)
+        start = time.perf_counter()
+        read_only = tool_name in self.read_only_tools
+        content = self.tool_cache.get(tool_name, tool_args) if read_only else None
+        if content is not None:
+            if stats:
+                stats.tool_seconds.append((f"{tool_name} (cached)", time.perf_counter() - start))
+            self.log(f"\nTool response from the cache (hit rate {self.tool_cache.hit_rate():.0%}): {content}", event="tool_response",
+                     tool=tool_name, cached=True, cache_hits=self.tool_cache.hits, cache_misses=self.tool_cache.misses)
+        else:
+            try:
+                result = await self.mcp_client.call_tool(tool_name, tool_args)
+            finally:
+                # The world changed, none of the cached results can be trusted
+                if not read_only:
+                    self.tool_cache.clear()
+            if stats:
+                stats.tool_seconds.append((tool_name, time.perf_counter() - start))
+            content = "\n".join(part.text for part in result.content if part.type == "text")
+            if read_only and self.tool_cache.cacheable(content, result.is_error):
+                self.tool_cache.put(tool_name, tool_args, content)
+            self.log(f"\nTool response: {result}", event="tool_response", tool=tool_name, cached=False)
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call["id"],
+            "content": content,
+        }
+
+
+    async def call_tools(self, tool_calls, stats = None):
+        # The consecutive read only tool calls run concurrently. A call that changes the world runs alone - after the calls
+        # before it and before the calls after it. The results keep the order of the calls
+        results = []
+        reads = []
+        for tool_call in tool_calls:
+            if tool_call["function"]["name"] in self.read_only_tools:
+                reads.append(self.call_tool(tool_call, stats))
+                continue
+            results.extend(await asyncio.gather(*reads))
+            reads = []
+            results.append(await self.call_tool(tool_call, stats))
+        results.extend(await asyncio.gather(*reads))
+        return results
 
 
     async def default(self, line):
@@ -221,7 +453,7 @@ class CliRpg(patched_cmd.Cmd):
             print(f"{Colors.BOLD}{Colors.RED}LLM API key not set!{Colors.RESET}")
             return
         
-        self.openai = OpenAI(api_key = self.api_key)
+        self.openai = AsyncOpenAI(api_key = self.api_key)
 
         self.in_game = True
         self.prompt = f"{Colors.BOLD}{Colors.GREEN}Player){Colors.RESET}{Colors.GREEN} "
@@ -233,6 +465,7 @@ class CliRpg(patched_cmd.Cmd):
         self.log("Succesfully ping'ed the server")
 
         await self.get_initial_prompts()
+        await self.get_world_resources()
         await self.get_available_tools()
 
     
@@ -246,9 +479,49 @@ class CliRpg(patched_cmd.Cmd):
                 "role": message.role,
                 "content": message.content.text
             })
-        self.messages = messages
+        self.memory.pin(messages)
 
     
+    async def get_world_resources(self):
+        # A small index of the static world (the IDs and names of the first locations and items) goes into the context once,
+        # so the LLM doesn't have to query it with tools every game - the details are read with tools when needed.
+        # The resources are paged; only the pages of the index are read, and only when the resource's version changed
+        cache = {}
+        if os.path.exists(WORLD_RESOURCES_CACHE_PATH):
+            with open(WORLD_RESOURCES_CACHE_PATH, 'r') as file:
+                cache = json.load(file)
+
+        versions = json.loads((await self.mcp_client.read_resource("world://versions"))[0].text)
+        for uri, version in versions.items():
+            cached = cache.get(uri)
+            if cached and cached["version"] == version and cached.get("index_rows") == self.world_index_rows:
+                self.log(f"World resource {uri} is up to date (version {version})")
+                continue
+
+            self.log(f"Reading world resource {uri} (version {version})...")
+            rows = []
+            page_uri = uri
+            while True:
+                page = json.loads((await self.mcp_client.read_resource(page_uri))[0].text)
+                key = next(key for key in page if key not in ("version", "total", "next_cursor"))
+                rows.extend([row["id"], row["name"]] for row in page[key])
+                if page["next_cursor"] is None or len(rows) >= self.world_index_rows:
+                    break
+                page_uri = f"{uri}/{page['next_cursor']}"
+            cache[uri] = {"version": version, "index_rows": self.world_index_rows, "key": key,
+                          "total": page["total"], "rows": rows[:self.world_index_rows]}
+
+        cache = {uri: cache[uri] for uri in versions}
+        with open(WORLD_RESOURCES_CACHE_PATH, 'w') as file:
+            json.dump(cache, file)
+
+        world_index = {resource["key"]: {"total": resource["total"], "listed (id, name)": resource["rows"]} for resource in cache.values()}
+        self.memory.pin([{
+            "role": "system",
+            "content": "The world index, the IDs are secret: " + json.dumps(world_index, separators = (',', ':'))
+        }])
+
+
     async def get_available_tools(self):
         self.log("Fetching available server tools...")
         response = await self.mcp_client.list_tools()
@@ -268,6 +541,8 @@ class CliRpg(patched_cmd.Cmd):
             for tool in response
         ]
         self.available_tools = available_tools
+        self.memory.reserve(estimate_tokens(available_tools))
+        self.read_only_tools = {tool.name for tool in response if tool.annotations and tool.annotations.readOnlyHint}
 
 
 
@@ -281,8 +556,21 @@ async def main():
     parser.add_argument('--api_key_file', help = '(Legacy - use .env file) Path to the file with the api key to the LLM')
     parser.add_argument('--api_key', help = '(Legacy - use .env file) The api key to the LLM')
     parser.add_argument('--verbose', action = 'store_true', default = False, help = 'Enable stdout logging')
+    parser.add_argument('--model', default = CliRpg.model, help = 'The OpenAI model of the game master (and of the summaries of the old turns)')
+    parser.add_argument('--max_tool_rounds', type = int, default = 5, help = 'Max model responses with tool calls per turn, then the model must answer')
+    parser.add_argument('--turn_budget', type = float, default = 60.0, help = 'Seconds per turn after which the model must answer without more tools')
+    parser.add_argument('--world_index_rows', type = int, default = 50, help = 'Max locations and max items (IDs and names) listed in the world index given to the LLM')
+    parser.add_argument('--context_budget', type = int, default = 12000, help = 'Estimated tokens of the context (with the tool definitions) sent to the LLM, the old turns are summarized to fit')
+    parser.add_argument('--keep_turns', type = int, default = 6, help = 'Last turns sent verbatim, the older ones go into the running summary')
+    parser.add_argument('--tool_cache_ttl', type = float, default = 60.0, help = 'Seconds the results of the read only tool calls are reused for, 0 disables the cache')
+    parser.add_argument('--tool_cache_size', type = int, default = 256, help = 'Max number of cached tool results')
+    parser.add_argument('--log_file', help = 'Also write the log as JSON lines to this file, rotated by size')
+    parser.add_argument('--log_max_bytes', type = int, default = 10 * 1024 * 1024, help = 'Size of the log file that triggers the rotation (with --log_file)')
+    parser.add_argument('--log_backups', type = int, default = 5, help = 'Number of the rotated log files kept (with --log_file)')
     args = parser.parse_args()
 
+    setup_logging(args.verbose, args.log_file, args.log_max_bytes, args.log_backups)
+
     if args.api_key_file:
         if not os.path.exists(args.api_key_file):
             print(f"{Colors.RED}The path {Colors.BOLD}{args.api_key_file}{Colors.RESET}{Colors.RED} does not point to a file{Colors.RESET}")
@@ -304,7 +592,17 @@ async def main():
     # Apparently the MCP server connection (Client(url)) needs to be init'ed in such a way because I tried it the "old-fashioned way" (i.e. client = Client(url)) but it didn't work
     async with Client(os.getenv("MCP_SERVER_URL")) as mcp_client:
         game = CliRpg(api_key, args.verbose, mcp_client)
-        await game.connect_to_mcp_server()
+        game.model = args.model
+        game.max_tool_rounds = args.max_tool_rounds
+        game.turn_budget = args.turn_budget
+        game.memory = ConversationMemory(args.context_budget, args.keep_turns)
+        game.world_index_rows = args.world_index_rows
+        game.tool_cache = ToolResultCache(args.tool_cache_ttl, args.tool_cache_size)
+        try:
+            await game.connect_to_mcp_server()
+        except ContextBudgetError as e:
+            print(f"{Colors.RED}{e} ({Colors.BOLD}--context_budget{Colors.RESET}{Colors.RED}){Colors.RESET}")
+            exit(1)
         await game.cmdloop()
 
 if __name__ == '__main__':
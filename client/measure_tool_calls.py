@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+from dotenv import load_dotenv
+from fastmcp import Client
+
+from client import CliRpg
+from memory import ConversationMemory
+from tool_cache import ToolResultCache
+
+# TERMINAL
+# For instance: python.exe measure_tool_calls.py --repeat 20
+# Measures whole game turns (process_game_line) whose model response asks for 1, 3 and 6 read only tool calls, against a
+# running server, with the calls run one after another and concurrently (as the client does). The LLM is a stub: its first
+# reply of the turn asks for the tool calls, the second one answers, each after --llm_latency_ms. A local server answers in
+# a few ms, --network_latency_ms adds a delay to every call, like the round trip to a remote server.
+
+# The read only calls of a typical "look around" turn
+READ_CALLS = [
+    ("get_npcs_in_location", {"location_id": 0}),
+    ("get_alive_enemies_in_location", {"location_id": 0}),
+    ("query_locations", {"action": "by_id", "id": 0}),
+    ("get_enemy_info_by_id", {"enemy_id": 0}),
+    ("get_characters_equipment", {"character_id": 0}),
+    ("get_item_by_id", {"item_id": 3}),
+]
+
+def tool_calls(count) -> list[dict]:
+    return [
+        {"id": f"call_{index}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+        for index, (name, arguments) in enumerate(READ_CALLS[:count])
+    ]
+
+class DelayedClient:
+    """The MCP client, with a delay added to every tool call"""
+    def __init__(self, mcp_client, delay):
+        self.mcp_client = mcp_client
+        self.delay = delay
+
+    async def call_tool(self, name, arguments):
+        await asyncio.sleep(self.delay)
+        return await self.mcp_client.call_tool(name, arguments)
+
+    def __getattr__(self, name):
+        return getattr(self.mcp_client, name)
+
+class StubbedLlmGame(CliRpg):
+    """The game with the LLM replaced by a stub - the first reply of a turn asks for self.calls, the second one answers"""
+    calls = []
+    llm_delay = 0.0
+
+    async def stream_completion(self, stats, tool_choice = "auto"):
+        await asyncio.sleep(self.llm_delay)
+        stats.llm_seconds += self.llm_delay
+        stats.llm_requests += 1
+        if stats.tool_rounds == 0 and tool_choice == "auto":
+            return {"role": "assistant", "content": None, "tool_calls": self.calls}, "tool_calls"
+        return {"role": "assistant", "content": "The Game Master answers."}, "stop"
+
+async def measure(game, repeat) -> float:
+    timings = []
+    for _ in range(repeat):
+        game.memory.clear()
+        start = time.perf_counter()
+        await game.process_game_line("I look around.")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+async def main(args):
+    async with Client(args.url) as mcp_client:
+        game = StubbedLlmGame(None, False, DelayedClient(mcp_client, args.network_latency_ms / 1000))
+        game.memory = ConversationMemory()
+        game.tool_cache = ToolResultCache(ttl=0) # Every measured call goes to the server
+        game.llm_delay = args.llm_latency_ms / 1000
+        await game.get_available_tools()
+        read_only_tools = game.read_only_tools
+
+        print(f"{'tool calls':>10}{'sequential turn ms':>21}{'concurrent turn ms':>21}{'speedup':>10}")
+        for count in args.calls:
+            game.calls = tool_calls(count)
+            await game.call_tools(game.calls) # Warm up
+            game.read_only_tools = set()
+            sequential = await measure(game, args.repeat)
+            game.read_only_tools = read_only_tools
+            concurrent = await measure(game, args.repeat)
+            print(f"{count:>10}{sequential * 1000:>21.1f}{concurrent * 1000:>21.1f}{sequential / concurrent:>9.1f}x")
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8080/mcp"), help='URL of the MCP server (default MCP_SERVER_URL)')
+    parser.add_argument('--calls', type=int, nargs='+', default=[1, 3, 6], choices=range(1, len(READ_CALLS) + 1), help='Tool calls per model response')
+    parser.add_argument('--network_latency_ms', type=float, default=0, help='Delay added to every tool call')
+    parser.add_argument('--llm_latency_ms', type=float, default=500, help='Time of every reply of the stubbed LLM')
+    parser.add_argument('--repeat', type=int, default=20, help='Measured turns per number of calls (the median is shown)')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -0,0 +1,127 @@
+import json
+import logging
+
+# The conversation sent to the LLM, kept within a token budget:
+# - the pinned messages (the initial prompts and the world data) are always sent
+# - the last keep_turns turns (a player's line and everything up to the Game Master's answer) are sent verbatim,
+#   except the tool calls and results of the finished turns, which are stale once the turn is over
+# - the older turns are folded into a running summary, written by the LLM
+# - if the budget still doesn't hold, the summary is shortened; the pinned messages are never cut - pinning more than
+#   the budget (with the tool definitions) is a configuration error, raised at startup
+
+CHARS_PER_TOKEN = 4 # A rough average for English text and JSON
+MESSAGE_OVERHEAD_TOKENS = 4 # The role and the separators of every message
+
+logger = logging.getLogger("rpg_client")
+
+def estimate_tokens(value) -> int:
+    """A local estimate of the tokens of a text or a JSON-like value (a message, the tool definitions)"""
+    if value is None:
+        return 0
+    if not isinstance(value, str):
+        value = json.dumps(value, separators=(",", ":"), default=str)
+    return (len(value) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def estimate_message_tokens(message) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content")) + estimate_tokens(message.get("tool_calls"))
+
+class ContextBudgetError(ValueError):
+    """The pinned messages (and the tool definitions) alone don't fit into the context budget"""
+    pass
+
+
+class ConversationMemory:
+    def __init__(self, budget_tokens=12000, keep_turns=6):
+        self.budget_tokens = budget_tokens
+        self.keep_turns = keep_turns
+        self.pinned = []
+        self.summary = ""
+        self.turns = [] # Lists of messages, every turn starts with the player's line
+        self.reserved_tokens = 0 # Sent with every request besides the messages, e.g. the tool definitions
+
+    def pin(self, messages):
+        self.pinned.extend(messages)
+        self.check_pinned_budget()
+
+    def reserve(self, tokens):
+        self.reserved_tokens = tokens
+        self.check_pinned_budget()
+
+    def pinned_tokens(self) -> int:
+        return self.reserved_tokens + sum(estimate_message_tokens(message) for message in self.pinned)
+
+    def check_pinned_budget(self):
+        tokens = self.pinned_tokens()
+        if tokens > self.budget_tokens:
+            raise ContextBudgetError(f"The pinned messages and the tool definitions take {tokens} tokens, "
+                                     f"over the context budget of {self.budget_tokens} tokens - raise the budget")
+
+    def add(self, message):
+        if message["role"] == "user":
+            if self.turns:
+                self.turns[-1] = self.without_tool_exchanges(self.turns[-1])
+            self.turns.append([])
+        elif not self.turns:
+            self.turns.append([])
+        self.turns[-1].append(message)
+
+    def clear(self):
+        # A new game - the pinned messages stay
+        self.summary = ""
+        self.turns = []
+
+    @staticmethod
+    def without_tool_exchanges(turn) -> list[dict]:
+        return [message for message in turn if message["role"] != "tool" and not message.get("tool_calls")]
+
+    def summary_message(self) -> list[dict]:
+        if not self.summary:
+            return []
+        return [{"role": "system", "content": "Summary of the game so far: " + self.summary}]
+
+    def messages(self) -> list[dict]:
+        return self.pinned + self.summary_message() + [message for turn in self.turns for message in turn]
+
+    def estimate_tokens(self) -> int:
+        return sum(estimate_message_tokens(message) for message in self.messages())
+
+    async def fit(self, summarize, reserved_tokens=None):
+        """
+        Folds the old turns into the summary - all but the last keep_turns once there are twice as many (so the summary is
+        rewritten every keep_turns turns, not every turn), and more while the messages and the reserved tokens (e.g. the
+        tool definitions, self.reserved_tokens by default) are over the budget. The current turn is never folded.
+        If the budget still doesn't hold, the summary is shortened (or dropped), the pinned messages are never cut.
+        summarize(summary, transcript) is awaited for the new summary.
+        """
+        if reserved_tokens is None:
+            reserved_tokens = self.reserved_tokens
+        fold = 0
+        if len(self.turns) > 2 * self.keep_turns:
+            fold = max(0, min(len(self.turns) - self.keep_turns, len(self.turns) - 1))
+        tokens = reserved_tokens + self.estimate_tokens()
+        turn_tokens = [sum(estimate_message_tokens(message) for message in turn) for turn in self.turns]
+        tokens -= sum(turn_tokens[:fold])
+        while tokens > self.budget_tokens and fold < len(self.turns) - 1:
+            tokens -= turn_tokens[fold]
+            fold += 1
+
+        if fold:
+            transcript = "\n".join(f"{'Player' if message['role'] == 'user' else 'Game Master'}: {message['content']}"
+                                   for turn in self.turns[:fold] for message in self.without_tool_exchanges(turn)
+                                   if message.get("content"))
+            self.summary = await summarize(self.summary, transcript)
+            self.turns = self.turns[fold:]
+
+        excess = reserved_tokens + self.estimate_tokens() - self.budget_tokens
+        if excess > 0 and self.summary:
+            summary_tokens = sum(estimate_message_tokens(message) for message in self.summary_message())
+            if excess >= summary_tokens:
+                self.summary = ""
+            else:
+                self.summary = self.summary[:len(self.summary) - excess * CHARS_PER_TOKEN]
+            logger.warning(f"The summary was {'dropped' if not self.summary else 'shortened'} to keep the context within its budget of {self.budget_tokens} tokens",
+                           extra={"fields": {"event": "summary_over_budget", "excess_tokens": excess}})
+            excess = reserved_tokens + self.estimate_tokens() - self.budget_tokens
+        if excess > 0:
+            logger.warning(f"The current turn alone is over the context budget of {self.budget_tokens} tokens",
+                           extra={"fields": {"event": "turn_over_budget", "excess_tokens": excess}})
@@ -0,0 +1,57 @@
+import json
+import time
+from collections import OrderedDict
+
+# The results of the read only tool calls, kept for a while so the repeated calls (the same item, NPC or location asked
+# for again in the session) are answered locally instead of over HTTP. Any call of a tool that changes the world clears
+# the cache; the TTL bounds how stale a result can get through the changes made by somebody else (e.g. another player).
+# Only the successful results are cached, a failure (e.g. a locked database) may be gone at the next call.
+
+# The responses the server reports its failures with instead of raising
+SERVER_ERROR_PREFIXES = ("DB Error:", "World expired:")
+
+class ToolResultCache:
+    def __init__(self, ttl=60.0, max_entries=256):
+        self.ttl = ttl # Seconds, 0 disables the cache
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # (tool, canonical arguments) -> (time stored, result), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(tool, arguments) -> tuple:
+        return tool, json.dumps(arguments, sort_keys=True, separators=(",", ":"))
+
+    def get(self, tool, arguments):
+        """The cached result of the call, or None"""
+        if self.ttl <= 0:
+            return None
+        key = self.key(tool, arguments)
+        entry = self.entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry:
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def cacheable(result, is_error=False) -> bool:
+        return not is_error and not result.startswith(SERVER_ERROR_PREFIXES)
+
+    def put(self, tool, arguments, result):
+        if self.ttl <= 0:
+            return
+        key = self.key(tool, arguments)
+        self.entries[key] = (time.monotonic(), result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def hit_rate(self) -> float:
+        return self.hits / max(1, self.hits + self.misses)
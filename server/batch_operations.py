@@ -0,0 +1,135 @@
+import inspect
+
+from formatting import CHARACTER_COLUMNS, ENEMY_COLUMNS, ITEM_COLUMNS
+
+# The game operations that can be run in a batch, named (and with the same arguments) as the MCP tools they map to.
+# Every handler runs inside the batch's transaction and returns either a message or the rows it read; a write that finds
+# nothing to change raises, so the batch is rolled back. The annotations of the arguments are checked by validate_operations.
+
+MAX_OPERATIONS = 50
+
+class BatchError(Exception):
+    """An operation of the batch failed inside the transaction, the whole batch was rolled back"""
+    def __init__(self, index, tool, error):
+        super().__init__(f"Operation [{index}] {tool} failed: {error}")
+        self.index = index
+        self.tool = tool
+
+def query_playable_characters(connection, action: str = "by_id", id: int = -1):
+    if action != "by_id":
+        raise ValueError("only the 'by_id' action can be batched")
+    return connection.execute("SELECT * FROM characters WHERE id = ?", (id,)).fetchall()
+
+def update_character_hitpoints(connection, id: int = -1, hitpoints: int = -1):
+    if not connection.execute("UPDATE characters SET hitpoints = ? WHERE id = ?", (hitpoints, id)).rowcount:
+        raise ValueError(f"no character found with ID {id}")
+    return f"Character {id} now has {hitpoints} hitpoints."
+
+def get_enemy_info_by_id(connection, enemy_id: int = -1):
+    return connection.execute("SELECT * FROM enemies WHERE id = ?", (enemy_id,)).fetchall()
+
+def update_enemy_hitpoints(connection, enemy_id: int = -1, new_hitpoints: int = -1):
+    if not connection.execute("UPDATE enemies SET hitpoints = ? WHERE id = ?", (new_hitpoints, enemy_id)).rowcount:
+        raise ValueError(f"no enemy found with ID {enemy_id}")
+    return f"Enemy {enemy_id} now has {new_hitpoints} hitpoints."
+
+def delete_dead_enemies_from_db(connection):
+    connection.execute("DELETE FROM enemies WHERE hitpoints <= 0")
+    return "Dead enemies deleted."
+
+def get_item_by_id(connection, item_id: int = -1):
+    return connection.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchall()
+
+def assign_item_to_character_equipment(connection, item_id: int = -1, character_id: int = -1):
+    if not connection.execute("UPDATE items SET owner_id = ? WHERE id = ?", (character_id, item_id)).rowcount:
+        raise ValueError(f"no item found with ID {item_id}")
+    return f"Item {item_id} assigned to character {character_id}."
+
+def remove_item_from_characters_equipment(connection, item_id: int = -1, character_id: int = -1):
+    if not connection.execute("DELETE FROM items WHERE id = ? AND owner_id = ?", (item_id, character_id)).rowcount:
+        raise ValueError(f"character {character_id} doesn't own an item with ID {item_id}")
+    return f"Item {item_id} removed from character {character_id}."
+
+def get_characters_equipment(connection, character_id: int = -1):
+    return connection.execute("SELECT * FROM items WHERE owner_id = ?", (character_id,)).fetchall()
+
+def get_loot_items_from_enemy(connection, enemy_id: int = -1):
+    return connection.execute("SELECT items.* FROM loot JOIN items ON items.id = loot.item_id WHERE loot.enemy_id = ?", (enemy_id,)).fetchall()
+
+# tool -> (handler, columns of the rows it reads or None for writes, (table, argument) of the cached rows it changes or None)
+OPERATIONS = {
+    "query_playable_characters": (query_playable_characters, CHARACTER_COLUMNS, None),
+    "update_character_hitpoints": (update_character_hitpoints, None, None),
+    "get_enemy_info_by_id": (get_enemy_info_by_id, ENEMY_COLUMNS, None),
+    "update_enemy_hitpoints": (update_enemy_hitpoints, None, ("enemies", "enemy_id")),
+    "delete_dead_enemies_from_db": (delete_dead_enemies_from_db, None, ("enemies", None)),
+    "get_item_by_id": (get_item_by_id, ITEM_COLUMNS, None),
+    "assign_item_to_character_equipment": (assign_item_to_character_equipment, None, ("items", "item_id")),
+    "remove_item_from_characters_equipment": (remove_item_from_characters_equipment, None, ("items", "item_id")),
+    "get_characters_equipment": (get_characters_equipment, ITEM_COLUMNS, None),
+    "get_loot_items_from_enemy": (get_loot_items_from_enemy, ITEM_COLUMNS, None),
+}
+
+def coerce(name, value, annotation):
+    """The argument converted to the annotated type of the tool's parameter, like the single tool calls. Raises ValueError"""
+    if annotation is int:
+        if isinstance(value, str) and value.strip().lstrip("+-").isdigit():
+            return int(value)
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    if annotation is str and not isinstance(value, str):
+        raise ValueError(f"{name} must be a string, got {value!r}")
+    return value
+
+def validate_operations(operations) -> list[tuple[str, dict]]:
+    """
+    Checks the operations before anything is run, returns them as (tool, args) tuples with the args converted to the types
+    of the tools' parameters. Raises ValueError when the batch is malformed or an argument has a wrong type
+    """
+    if not operations:
+        raise ValueError("No operations given.")
+    if len(operations) > MAX_OPERATIONS:
+        raise ValueError(f"Too many operations, at most {MAX_OPERATIONS} can be batched.")
+
+    validated = []
+    for index, operation in enumerate(operations, start=1):
+        tool = operation.get("tool") if isinstance(operation, dict) else None
+        args = (operation.get("args") or {}) if isinstance(operation, dict) else None
+        if tool not in OPERATIONS:
+            raise ValueError(f"Operation [{index}]: {tool} can't be batched, use one of: {', '.join(OPERATIONS)}.")
+        if not isinstance(args, dict):
+            raise ValueError(f"Operation [{index}] {tool}: args must be an object.")
+        signature = inspect.signature(OPERATIONS[tool][0])
+        try:
+            signature.bind(None, **args)
+        except TypeError as e:
+            raise ValueError(f"Operation [{index}] {tool}: {e}.")
+        try:
+            args = {name: coerce(name, value, signature.parameters[name].annotation) for name, value in args.items()}
+        except ValueError as e:
+            raise ValueError(f"Operation [{index}] {tool}: {e}.")
+        validated.append((tool, args))
+    return validated
+
+def run_batch(connection, operations) -> list:
+    """Runs the validated operations in order, inside a Database.transaction. Returns their results"""
+    results = []
+    for index, (tool, args) in enumerate(operations, start=1):
+        try:
+            results.append(OPERATIONS[tool][0](connection, **args))
+        except Exception as e:
+            raise BatchError(index, tool, e)
+    return results
+
+def invalidations(operations) -> list[tuple[str, int | None]]:
+    """The (table, id) cache entries changed by the operations, id None means the whole table"""
+    changed = []
+    for tool, args in operations:
+        invalidation = OPERATIONS[tool][2]
+        if invalidation:
+            table, argument = invalidation
+            changed.append((table, args.get(argument, -1) if argument else None))
+    return changed
@@ -0,0 +1,236 @@
+import os
+import sys
+import time
+import logging
+import subprocess
+import multiprocessing
+import random
+import asyncio
+import argparse
+import tempfile
+
+from database import Database
+from router import wait_for_port
+import server
+
+# TERMINAL
+# For instance: python.exe benchmark.py tool_latency --sessions 50
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def print_latencies(title, latencies):
+    print(f"{title}: calls: {len(latencies)}, "
+          f"p50: {percentile(latencies, 50) * 1000:.2f} ms, "
+          f"p99: {percentile(latencies, 99) * 1000:.2f} ms, "
+          f"max: {max(latencies) * 1000:.2f} ms")
+
+def make_world(directory, name, **kwargs) -> Database:
+    world = Database(db_name=os.path.join(directory, name), **kwargs)
+    world.soft_restart_db()
+    # Every commit really hits the disk, like it does on a production box
+    world.connection.execute("PRAGMA synchronous = FULL")
+    return world
+
+async def game_session(session_id, turns, interval, latencies):
+    # A scripted "player": look around, fight a bit, check the equipment
+    rng = random.Random(session_id)
+    calls = [
+        lambda: server.query_locations("by_id", rng.randint(0, 4)),
+        lambda: server.get_alive_enemies_in_location(rng.randint(0, 4)),
+        lambda: server.update_enemy_hitpoints(rng.randint(0, 21), rng.randint(1, 100)),
+        lambda: server.update_character_hitpoints(rng.randint(0, 2), rng.randint(1, 100)),
+        lambda: server.get_characters_equipment(rng.randint(0, 2)),
+        lambda: server.get_loot_items_from_enemy(rng.randint(0, 21)),
+    ]
+
+    # Open loop: every call has a planned start time, so the time spent waiting for a blocked event loop is measured too
+    start = time.perf_counter() + rng.random() * interval
+    for turn in range(turns):
+        planned = start + turn * interval
+        await asyncio.sleep(max(0.0, planned - time.perf_counter()))
+        await rng.choice(calls)()
+        latencies.append(time.perf_counter() - planned)
+
+# A heavy read (e.g. a report scanning a large world), SQLite releases the GIL while it runs
+SLOW_QUERY = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) SELECT count(*) FROM n"
+
+def calibrate_slow_query(world, milliseconds) -> int:
+    """Number of rows SLOW_QUERY has to count to run for about the given time"""
+    rows = 100_000
+    start = time.perf_counter()
+    world.execute_read(SLOW_QUERY, (rows,)).fetchone()
+    return max(1, int(rows * milliseconds / 1000 / (time.perf_counter() - start)))
+
+async def slow_queries(rows, interval, stop):
+    # Runs next to the players, its own latency isn't measured - only how much it holds up their calls
+    while not stop.is_set():
+        await server.db.read_one(SLOW_QUERY, (rows,))
+        await asyncio.sleep(interval)
+
+async def loop_lag(lags, stop, period=0.001):
+    # How late a timer fires - the wait of everything else on the event loop (HTTP requests, cached rows, ...)
+    while not stop.is_set():
+        planned = time.perf_counter() + period
+        await asyncio.sleep(period)
+        lags.append(time.perf_counter() - planned)
+
+async def run_sessions(sessions, turns, interval, slow_query_rows=0, slow_query_interval=0.0) -> tuple[list[float], list[float]]:
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    background = [asyncio.create_task(loop_lag(lags, stop))]
+    if slow_query_rows:
+        background.append(asyncio.create_task(slow_queries(slow_query_rows, slow_query_interval, stop)))
+    await asyncio.gather(*(game_session(i, turns, interval, latencies) for i in range(sessions)))
+    stop.set()
+    await asyncio.gather(*background)
+    return latencies, lags
+
+def tool_latency(args):
+    with tempfile.TemporaryDirectory() as directory:
+        for title, use_db_thread, pooled in (("Blocking (before)", False, False), ("DB thread (after)", True, False),
+                                             ("DB thread + read pool (--pooled_db)", True, True)):
+            server.db = make_world(directory, f"{use_db_thread}-{pooled}.db", use_db_thread=use_db_thread)
+            slow_query_rows = calibrate_slow_query(server.db, args.slow_query_ms) if args.slow_query_ms > 0 else 0
+            if pooled:
+                server.db.enable_pooling()
+            latencies, lags = asyncio.run(run_sessions(args.sessions, args.turns, args.interval, slow_query_rows, args.slow_query_interval))
+            server.db.close()
+            print_latencies(title, latencies)
+            print_latencies("    event loop lag", lags)
+
+async def concurrent_hitpoint_updates(players, updates) -> float:
+    async def player(player_id):
+        for hitpoints in range(updates):
+            await server.update_character_hitpoints(player_id % 3, hitpoints)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(player(i) for i in range(players)))
+    return players * updates / (time.perf_counter() - start)
+
+def write_throughput(args):
+    with tempfile.TemporaryDirectory() as directory:
+        for title, pooled in (("Commit per write", False), ("Group commit", True)):
+            server.db = make_world(directory, f"{pooled}.db")
+            if pooled:
+                server.db.enable_pooling(commit_latency=args.commit_latency_ms / 1000, commit_batch_size=args.commit_batch_size)
+            writes_per_second = asyncio.run(concurrent_hitpoint_updates(args.players, args.updates))
+            server.db.close()
+            print(f"{title}: {writes_per_second:.0f} HP updates / s")
+
+def reset_time(args):
+    with tempfile.TemporaryDirectory() as directory:
+        world = make_world(directory, "reset.db")
+
+        def clear_and_populate():
+            world.clear_db()
+            world.populate_db()
+
+        for title, reset in (("DELETE + populate_db (before)", clear_and_populate), ("Template backup (after)", world.soft_restart_db)):
+            timings = []
+            for _ in range(args.resets):
+                start = time.perf_counter()
+                reset()
+                timings.append(time.perf_counter() - start)
+            print_latencies(title, timings)
+        world.close()
+
+# (tool, arguments) of the server throughput load - mostly reads, with some writes
+def random_tool_call(rng):
+    return rng.choice([
+        ("describe_location_snapshot", {"location_id": rng.randint(0, 4)}),
+        ("get_alive_enemies_in_location", {"location_id": rng.randint(0, 4)}),
+        ("get_characters_equipment", {"character_id": rng.randint(0, 2)}),
+        ("get_item_by_id", {"item_id": rng.randint(0, 20)}),
+        ("update_character_hitpoints", {"id": rng.randint(0, 2), "hitpoints": rng.randint(1, 100)}),
+    ])
+
+async def server_load(url, sessions, duration, seed) -> tuple[int, int]:
+    # The MCP client comes with the mcp package, so it's imported only by the benchmarks that talk to a real server
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    # The mcp package logs every HTTP request and session of its client
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("mcp").setLevel(logging.WARNING)
+
+    deadline = time.perf_counter() + duration
+    counts = [0, 0] # calls, errors
+
+    async def session(session_id):
+        rng = random.Random(seed * 1000 + session_id)
+        async with streamablehttp_client(url) as (read, write, _):
+            async with ClientSession(read, write) as client:
+                await client.initialize()
+                while time.perf_counter() < deadline:
+                    name, arguments = random_tool_call(rng)
+                    result = await client.call_tool(name, arguments)
+                    counts[0] += 1
+                    if result.isError or result.content[0].text.startswith("DB Error:"):
+                        counts[1] += 1
+
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    return counts[0], counts[1]
+
+def run_server_load(url, sessions, duration, seed) -> tuple[int, int]:
+    return asyncio.run(server_load(url, sessions, duration, seed))
+
+def workers_throughput(args):
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    url = f"http://127.0.0.1:{args.port}/mcp"
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in args.workers:
+            db_file = os.path.join(directory, f"workers-{workers}.db")
+            process = subprocess.Popen([sys.executable, server_path, "--port", str(args.port), "--workers", str(workers),
+                                        "--db_file", db_file, "--soft_restart_db"],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port(args.port)
+                run_server_load(url, 1, 0.5, 0) # Warm up
+                # The load comes from several processes, so the MCP clients don't bottleneck the measured servers
+                with multiprocessing.Pool(args.load_processes) as pool:
+                    results = pool.starmap(run_server_load, [(url, args.sessions, args.duration, seed) for seed in range(args.load_processes)])
+            finally:
+                process.terminate()
+                process.wait()
+
+            calls = sum(result[0] for result in results)
+            errors = sum(result[1] for result in results)
+            print(f"{workers} worker(s){' (router)' if workers > 1 else ''}: {calls / args.duration:.0f} tool calls / s, errors: {errors}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    latency_parser = subparsers.add_parser('tool_latency', help='p99 tool latency with many concurrent sessions')
+    latency_parser.add_argument('--sessions', type=int, default=50, help='Number of concurrent player sessions')
+    latency_parser.add_argument('--turns', type=int, default=40, help='Tool calls made by each session')
+    latency_parser.add_argument('--interval', type=float, default=0.05, help='Seconds between the calls of one session')
+    latency_parser.add_argument('--slow_query_ms', type=float, default=50.0, help='Duration of the slow query run next to the sessions, 0 to run none')
+    latency_parser.add_argument('--slow_query_interval', type=float, default=0.2, help='Seconds between the slow queries')
+    latency_parser.set_defaults(run=tool_latency)
+
+    throughput_parser = subparsers.add_parser('write_throughput', help='HP updates per second with many players at once')
+    throughput_parser.add_argument('--players', type=int, default=50, help='Number of players updating their hitpoints')
+    throughput_parser.add_argument('--updates', type=int, default=40, help='HP updates made by each player')
+    throughput_parser.add_argument('--commit_latency_ms', type=float, default=0.0, help='Group commit latency')
+    throughput_parser.add_argument('--commit_batch_size', type=int, default=64, help='Group commit batch size')
+    throughput_parser.set_defaults(run=write_throughput)
+
+    reset_parser = subparsers.add_parser('reset_time', help='Time of a world reset (--soft_restart_db)')
+    reset_parser.add_argument('--resets', type=int, default=200, help='Number of resets')
+    reset_parser.set_defaults(run=reset_time)
+
+    workers_parser = subparsers.add_parser('workers', help='Tool calls per second of a real server with 1, 2, 4 and 8 worker processes')
+    workers_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Numbers of workers to compare')
+    workers_parser.add_argument('--port', type=int, default=8090, help='Port of the measured server')
+    workers_parser.add_argument('--load_processes', type=int, default=4, help='Number of processes making the calls')
+    workers_parser.add_argument('--sessions', type=int, default=8, help='Concurrent MCP sessions per load process')
+    workers_parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per number of workers')
+    workers_parser.set_defaults(run=workers_throughput)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,62 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+from database import Database
+import server
+
+# TERMINAL
+# For instance: python.exe check_query_counts.py
+# Exits with 1 when any tool runs more SQL statements than its documented max_queries (see game_tool in server.py)
+
+# (tool, kwargs) - cold cache calls, so the cached lookups are counted too
+TOOL_CALLS = [
+    (server.query_playable_characters, {"action": "all"}),
+    (server.query_playable_characters, {"action": "by_id", "id": 0}),
+    (server.create_and_add_new_character, {"name": "Query Counter", "class_name": "Mage", "race": "Human", "hitpoints": 50}),
+    (server.update_character_hitpoints, {"id": 0, "hitpoints": 80}),
+    (server.query_locations, {"action": "all"}),
+    (server.query_locations, {"action": "by_id", "id": 1}),
+    (server.describe_location_snapshot, {"location_id": 1}),
+    (server.get_alive_enemies_in_location, {"location_id": 1}),
+    (server.are_any_enemies_in_location, {"location_id": 1}),
+    (server.get_enemy_info_by_id, {"enemy_id": 6}),
+    (server.get_loot_items_from_enemy, {"enemy_id": 6}),
+    (server.resolve_attack, {"character_id": 1, "enemy_id": 1, "item_id": 1}),
+    (server.resolve_attack, {"character_id": 1, "enemy_id": 2, "item_id": 1}),
+    (server.resolve_attack, {"character_id": 0, "enemy_id": 0, "item_id": -1}),
+    (server.update_enemy_hitpoints, {"enemy_id": 0, "new_hitpoints": 0}),
+    (server.delete_dead_enemies_from_db, {}),
+    (server.get_npcs_in_location, {"location_id": 0}),
+    (server.get_npc_info_by_id, {"npc_id": 0}),
+    (server.get_quest_reward_item, {"npc_id": 1}),
+    (server.get_item_by_id, {"item_id": 13}),
+    (server.assign_item_to_character_equipment, {"item_id": 13, "character_id": 0}),
+    (server.get_characters_equipment, {"character_id": 0}),
+    (server.remove_item_from_characters_equipment, {"item_id": 3, "character_id": 0}),
+    (server.batch, {"operations": [{"tool": "update_character_hitpoints", "args": {"id": 1, "hitpoints": 90}},
+                                   {"tool": "get_loot_items_from_enemy", "args": {"enemy_id": 6}},
+                                   {"tool": "assign_item_to_character_equipment", "args": {"item_id": 12, "character_id": 1}}]}),
+]
+
+async def check_query_counts() -> bool:
+    ok = True
+    for tool, kwargs in TOOL_CALLS:
+        with Database.count_queries() as counter:
+            await tool(**kwargs)
+        if counter.count > tool.max_queries:
+            ok = False
+            print(f"{tool.__name__} ran {counter.count} queries, its limit is {tool.max_queries}")
+    return ok
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        server.db = Database(db_name=os.path.join(directory, "query_counts.db"))
+        server.db.soft_restart_db()
+        ok = asyncio.run(check_query_counts())
+        server.db.close()
+
+    if not ok:
+        sys.exit(1)
+    print(f"All {len(TOOL_CALLS)} tool calls stayed within their query limits.")
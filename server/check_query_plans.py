@@ -0,0 +1,61 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+from database import Database
+from check_query_counts import TOOL_CALLS
+import server
+
+# TERMINAL
+# For instance: python.exe check_query_plans.py
+# Runs the tool calls of check_query_counts.py, records the SQL statements they actually run (the sqlite3 trace callback)
+# and exits with 1 when any of them does a full table scan (EXPLAIN QUERY PLAN "SCAN ...") that isn't allowed below
+
+# Statements that read whole tables on purpose
+WHOLE_TABLE_STATEMENTS = {
+    "SELECT COUNT(*) FROM characters", # The total count of the query_playable_characters "all" pages
+    "SELECT COUNT(*) FROM location", # The total count of the query_locations "all" pages
+    "DELETE FROM enemies WHERE hitpoints <= 0", # delete_dead_enemies_from_db sweeps the whole world, an index on the hitpoints would slow down every HP update
+}
+
+# Foreign key lookups done by SQLite itself (not traced) when an item is deleted by remove_item_from_characters_equipment
+FOREIGN_KEY_STATEMENTS = [
+    "SELECT * FROM loot WHERE item_id = 0",
+    "SELECT * FROM npc WHERE reward_id = 0",
+]
+
+async def record_tool_statements() -> list[tuple[str, str]]:
+    """(tool, statement) of every distinct statement run by the tool calls, cold cache"""
+    tool_statements = {}
+    for tool, kwargs in TOOL_CALLS:
+        with Database.record_statements() as statements:
+            await tool(**kwargs)
+        for statement in statements:
+            tool_statements.setdefault(statement, tool.__name__)
+    for statement in FOREIGN_KEY_STATEMENTS:
+        tool_statements.setdefault(statement, "remove_item_from_characters_equipment")
+    return [(tool, statement) for statement, tool in tool_statements.items()]
+
+def check_query_plans(db, tool_statements) -> bool:
+    ok = True
+    for tool, statement in tool_statements:
+        if statement in WHOLE_TABLE_STATEMENTS:
+            continue
+        scans = db.full_table_scans(statement)
+        if scans:
+            ok = False
+            print(f"FULL SCAN in {tool}: {statement} -> {', '.join(scans)}")
+    return ok
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        server.db = Database(db_name=os.path.join(directory, "query_plans.db"))
+        server.db.soft_restart_db()
+        tool_statements = asyncio.run(record_tool_statements())
+        ok = check_query_plans(server.db, tool_statements)
+        server.db.close()
+
+    if not ok:
+        sys.exit(1)
+    print(f"All {len(tool_statements)} tool statements use indexes.")
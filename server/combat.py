@@ -0,0 +1,87 @@
+import math
+import random
+
+UNARMED_DAMAGE = 5
+DAMAGE_SPREAD = 0.2 # Every hit deals its base damage +/- 20%
+MAX_BLOCKED_SHARE = 0.75 # The armor and the shield never block more of a hit than this
+
+# The damage reduction of a character: its best armor plus its best shield (one of each is worn), by hitpoint impact
+DAMAGE_REDUCTION_QUERY = """
+    SELECT COALESCE(MAX(CASE WHEN type LIKE '%Armor%' THEN hitpoint_impact END), 0)
+         + COALESCE(MAX(CASE WHEN type LIKE '%Shield%' THEN hitpoint_impact END), 0)
+    FROM items WHERE owner_id = ?
+"""
+
+class CombatError(Exception):
+    """The attack can't happen (missing character, dead enemy, not owned weapon...), nothing was changed"""
+    pass
+
+def roll_damage(rng: random.Random, base_damage) -> int:
+    if not base_damage or base_damage <= 0:
+        return 0
+    return max(1, round(base_damage * rng.uniform(1 - DAMAGE_SPREAD, 1 + DAMAGE_SPREAD)))
+
+def damage_after_reduction(damage, damage_reduction) -> int:
+    """The damage that gets through the armor and the shield - at least the share MAX_BLOCKED_SHARE doesn't block"""
+    unblockable = math.ceil(damage * (1 - MAX_BLOCKED_SHARE))
+    return max(unblockable, damage - max(0, damage_reduction))
+
+def resolve_attack(connection, rng: random.Random, character_id, enemy_id, item_id=-1) -> dict:
+    """
+    One combat round, run inside a Database.transaction: the character attacks the enemy with the item (or unarmed with item_id -1),
+    then the enemy, if it survived, strikes back. Both hitpoint changes are written, a defeated enemy is removed from the DB
+    together with its loot table entries - the loot items themselves stay, unowned, and are returned so they can be assigned.
+    The enemy's damage is reduced by the character's own armor and shield (see DAMAGE_REDUCTION_QUERY and damage_after_reduction).
+    """
+    character = connection.execute("SELECT * FROM characters WHERE id = ?", (character_id,)).fetchone()
+    if not character:
+        raise CombatError(f"No character found with ID {character_id}.")
+    if character['hitpoints'] <= 0:
+        raise CombatError(f"Character {character['name']} is dead and can't attack.")
+
+    weapon_damage = UNARMED_DAMAGE
+    weapon_name = "bare hands"
+    if item_id is not None and item_id >= 0:
+        weapon = connection.execute("SELECT * FROM items WHERE id = ? AND owner_id = ?", (item_id, character_id)).fetchone()
+        if not weapon:
+            raise CombatError(f"Character {character['name']} doesn't own an item with ID {item_id}.")
+        if not weapon['type'] or "Weapon" not in weapon['type']:
+            raise CombatError(f"{weapon['name']} is a {weapon['type']}, not a weapon.")
+        weapon_damage = weapon['hitpoint_impact']
+        weapon_name = weapon['name']
+
+    enemy = connection.execute("SELECT * FROM enemies WHERE id = ?", (enemy_id,)).fetchone()
+    if not enemy or enemy['hitpoints'] <= 0:
+        raise CombatError(f"No alive enemy found with ID {enemy_id}.")
+
+    damage_dealt = roll_damage(rng, weapon_damage)
+    enemy_hitpoints = enemy['hitpoints'] - damage_dealt
+    outcome = {
+        "character_id": character_id,
+        "character_name": character['name'],
+        "weapon": weapon_name,
+        "enemy_id": enemy_id,
+        "enemy_name": enemy['name'],
+        "damage_dealt": damage_dealt,
+        "enemy_hitpoints": max(0, enemy_hitpoints),
+        "enemy_defeated": enemy_hitpoints <= 0,
+        "damage_taken": 0,
+        "character_hitpoints": character['hitpoints'],
+        "character_dead": False,
+    }
+
+    if outcome["enemy_defeated"]:
+        loot = connection.execute("SELECT items.* FROM loot JOIN items ON items.id = loot.item_id WHERE loot.enemy_id = ?", (enemy_id,)).fetchall()
+        connection.execute("DELETE FROM loot WHERE enemy_id = ?", (enemy_id,))
+        connection.execute("DELETE FROM enemies WHERE id = ?", (enemy_id,))
+        return {"outcome": outcome, "loot": loot}
+
+    # The enemy survived and strikes back
+    damage_reduction = connection.execute(DAMAGE_REDUCTION_QUERY, (character_id,)).fetchone()[0]
+    damage_taken = damage_after_reduction(roll_damage(rng, enemy['base_damage']), damage_reduction)
+    outcome["damage_taken"] = damage_taken
+    outcome["character_hitpoints"] = max(0, character['hitpoints'] - damage_taken)
+    outcome["character_dead"] = outcome["character_hitpoints"] <= 0
+    connection.execute("UPDATE enemies SET hitpoints = ? WHERE id = ?", (enemy_hitpoints, enemy_id))
+    connection.execute("UPDATE characters SET hitpoints = ? WHERE id = ?", (outcome["character_hitpoints"], character_id))
+    return {"outcome": outcome, "loot": []}
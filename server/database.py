@@ -1,17 +1,400 @@
 import sqlite3
+import asyncio
+import os
+import zlib
+import functools
+import contextlib
+import contextvars
+import threading
+import queue
+import time
+import pathlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from metrics import QUERY_DURATION, COMMIT_DURATION, ROWS_RETURNED, ROW_CACHE_LOOKUPS
+from world_io import import_world
+
+
+# The hand made world, the content of fresh databases and of the template (see world_io.py for the format)
+DEFAULT_CAMPAIGN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "campaigns", "default.jsonl")
+
+# Numbered schema migrations, tracked with PRAGMA user_version. Append new ones at the end, never edit the applied ones.
+# They have to be idempotent (IF NOT EXISTS etc.), as force_table_update re-applies all of them.
+MIGRATIONS = [
+    (1, "Initial schema", """
+    CREATE TABLE IF NOT EXISTS location (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR,
+        description TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS characters (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR,
+        class VARCHAR,
+        race VARCHAR,
+        hitpoints INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY,
+        owner_id INTEGER,
+        name VARCHAR,
+        type VARCHAR,
+        functional_descr TEXT,
+        hitpoint_impact INTEGER,
+        rarity INTEGER,
+        FOREIGN KEY(owner_id) REFERENCES characters(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS enemies (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR,
+        description TEXT,
+        hitpoints INTEGER,
+        base_damage INTEGER,
+        spawn_location INTEGER,
+        FOREIGN KEY(spawn_location) REFERENCES location(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS npc (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR,
+        description TEXT,
+        information_to_give TEXT,
+        quest_to_give TEXT,
+        spawn_location INTEGER,
+        reward_id INTEGER,
+        FOREIGN KEY(spawn_location) REFERENCES location(id),
+        FOREIGN KEY(reward_id) REFERENCES items(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS loot (
+        enemy_id INTEGER,
+        item_id INTEGER,
+        PRIMARY KEY (enemy_id, item_id),
+        FOREIGN KEY(enemy_id) REFERENCES enemies(id),
+        FOREIGN KEY(item_id) REFERENCES items(id)
+    );
+    """),
+
+    (2, "Indexes for the location, owner, reward and loot lookups", """
+    CREATE INDEX IF NOT EXISTS idx_enemies_spawn_location ON enemies (spawn_location, hitpoints);
+    CREATE INDEX IF NOT EXISTS idx_npc_spawn_location ON npc (spawn_location);
+    CREATE INDEX IF NOT EXISTS idx_npc_reward_id ON npc (reward_id);
+    CREATE INDEX IF NOT EXISTS idx_items_owner_id ON items (owner_id);
+    CREATE INDEX IF NOT EXISTS idx_loot_item_id ON loot (item_id);
+    """),
+]
+
+# Everything the Game Master needs when the player enters a location, in one query: the location itself,
+# its NPCs and its alive enemies joined with their loot (one row per loot item). The kind column tells the rows apart.
+LOCATION_SNAPSHOT_QUERY = """
+    SELECT 0 AS kind, l.id, l.name, l.description,
+           NULL AS information_to_give, NULL AS quest_to_give, NULL AS reward_id, NULL AS hitpoints, NULL AS base_damage,
+           NULL AS item_id, NULL AS item_name, NULL AS item_type, NULL AS item_descr, NULL AS item_hitpoint_impact, NULL AS item_rarity, NULL AS item_owner_id
+    FROM location l WHERE l.id = :location_id
+    UNION ALL
+    SELECT 1, n.id, n.name, n.description, n.information_to_give, n.quest_to_give, n.reward_id, NULL, NULL,
+           NULL, NULL, NULL, NULL, NULL, NULL, NULL
+    FROM npc n WHERE n.spawn_location = :location_id
+    UNION ALL
+    SELECT 2, e.id, e.name, e.description, NULL, NULL, NULL, e.hitpoints, e.base_damage,
+           i.id, i.name, i.type, i.functional_descr, i.hitpoint_impact, i.rarity, i.owner_id
+    FROM enemies e
+    LEFT JOIN loot lt ON lt.enemy_id = e.id
+    LEFT JOIN items i ON i.id = lt.item_id
+    WHERE e.spawn_location = :location_id AND e.hitpoints > 0
+    ORDER BY kind, id, item_id
+"""
+LOCATION_SNAPSHOT_LOCATION, LOCATION_SNAPSHOT_NPC, LOCATION_SNAPSHOT_ENEMY = 0, 1, 2
+
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+# The counter of the request (tool call) being served. The DB threads run the work in the context of the request that
+# submitted it, so the statements are counted for the right request even with many of them in flight
+current_query_counter = contextvars.ContextVar("current_query_counter", default=None)
+COUNTED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+# The list the statements are recorded to (see Database.record_statements), independent of the nested request counters
+current_statement_log = contextvars.ContextVar("current_statement_log", default=None)
+
+def count_statement(statement):
+    """sqlite3 trace callback, counts (and records) the statements run for the current request"""
+    if not statement.lstrip()[:7].upper().startswith(COUNTED_STATEMENTS):
+        return
+    counter = current_query_counter.get()
+    if counter is not None:
+        counter.count += 1
+    statement_log = current_statement_log.get()
+    if statement_log is not None:
+        statement_log.append(statement)
+
+
+class GroupCommitWriter:
+    """
+    The single writer of a pooled Database. Drains the write queue on its own thread and commits the writes in batches,
+    so many concurrent writes share one transaction (and one fsync) instead of committing one by one.
+    Every write runs under its own SAVEPOINT, so a failing write is rolled back alone and doesn't take the batch down.
+    """
+    def __init__(self, connection, commit_latency=0.0, batch_size=64):
+        self.connection = connection
+        self.commit_latency = commit_latency # Extra time the first write of a batch may wait for company, 0 commits once the queue is empty
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, function) -> Future:
+        """function(connection) is run inside the batch's transaction, it must not commit by itself"""
+        future = Future()
+        self.queue.put((functools.partial(contextvars.copy_context().run, function), future, True))
+        return future
+
+    def call(self, function) -> Future:
+        """function(connection) is run on the writer thread outside of any transaction, between the batches"""
+        future = Future()
+        self.queue.put((functools.partial(contextvars.copy_context().run, function), future, False))
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self.queue.get()
+            if first is None:
+                return
+            if not first[2]:
+                self._call(first)
+                continue
+            batch = [first[:2]]
+            call = None
+            deadline = time.monotonic() + self.commit_latency
+            while len(batch) < self.batch_size:
+                # The writes already waiting join the batch, an empty queue commits it right away -
+                # only a positive commit_latency makes the batch wait for more writes
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                if not item[2]:
+                    # A call ends the batch, so it doesn't wait for the whole commit latency
+                    call = item
+                    break
+                batch.append(item[:2])
+            self._commit(batch)
+            if call:
+                self._call(call)
+
+    def _call(self, item):
+        function, future, _ = item
+        try:
+            future.set_result(function(self.connection))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _commit(self, batch):
+        results = []
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            for function, future in batch:
+                self.connection.execute("SAVEPOINT group_write")
+                start = time.perf_counter()
+                try:
+                    results.append((future, function(self.connection), None))
+                    self.connection.execute("RELEASE group_write")
+                except Exception as e:
+                    self.connection.execute("ROLLBACK TO group_write")
+                    self.connection.execute("RELEASE group_write")
+                    results.append((future, None, e))
+                QUERY_DURATION.observe(time.perf_counter() - start, "transaction")
+            start = time.perf_counter()
+            self.connection.commit()
+            COMMIT_DURATION.observe(time.perf_counter() - start)
+        except Exception as e:
+            if self.connection.in_transaction:
+                self.connection.rollback()
+            results = [(future, None, e) for _, future in batch]
+
+        for future, result, error in results:
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class RowCache:
+    """
+    Size capped LRU cache of the rows of the (almost) static tables, keyed by table and primary key.
+    The tools that change a cached table must invalidate the changed rows.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.rows = OrderedDict() # (table, id) -> row, least recently used first
+        self.generations = {} # table -> number of invalidations, so reads racing with a write don't cache stale rows
+        self.epoch = 0 # Number of clears (world resets), they change every table
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table, id):
+        row = self.rows.get((table, id))
+        if row is None:
+            self.misses += 1
+            ROW_CACHE_LOOKUPS.inc("miss")
+            return None
+        self.hits += 1
+        ROW_CACHE_LOOKUPS.inc("hit")
+        self.rows.move_to_end((table, id))
+        return row
+
+    def peek(self, table, id):
+        """The cached row or None, without counting a hit or a miss and without touching the LRU order"""
+        return self.rows.get((table, id))
+
+    def generation(self, table) -> tuple[int, int]:
+        """Changes every time the table's rows are invalidated, so data derived from the table can be checked for staleness"""
+        return self.epoch, self.generations.get(table, 0)
+
+    def put(self, table, id, row, generation):
+        if self.max_size <= 0 or generation != self.generation(table):
+            return
+        self.rows[(table, id)] = row
+        self.rows.move_to_end((table, id))
+        while len(self.rows) > self.max_size:
+            self.rows.popitem(last=False)
+
+    def invalidate(self, table, id=None):
+        """Drops the row with the given id, or all the rows of the table when id is None"""
+        self.generations[table] = self.generations.get(table, 0) + 1
+        if id is not None:
+            self.rows.pop((table, id), None)
+        else:
+            for key in [key for key in self.rows if key[0] == table]:
+                del self.rows[key]
+
+    def clear(self):
+        self.epoch += 1
+        self.rows.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
 
 class Database:
-    def __init__(self, db_name="rpg_database.db", force_table_update=False, clear_previous=False):
-        self.connection = sqlite3.connect(db_name)
+    def __init__(self, db_name="rpg_database.db", force_table_update=False, clear_previous=False, use_db_thread=True, cache_size=1024):
+        self.db_name = db_name
+        # check_same_thread is disabled because the connection is handed over to the DB thread (or the writer) below
+        self.connection = sqlite3.connect(db_name, check_same_thread=False)
         self.connection.row_factory = sqlite3.Row
+        self.connection.set_trace_callback(count_statement)
         if clear_previous:
             self.remove_tables_from_db()
         self.init_db(force_table_update)
         self.cursor = self.connection.cursor()
 
+        # The async methods (read_all, read_one, write, transaction) run all the SQLite work on this single thread, so
+        # a slow query or commit never blocks the event loop. With use_db_thread=False they run inline (old behaviour)
+        self.db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite") if use_db_thread else None
+
+        # Read-through cache of the static world content, see read_row
+        self.cache = RowCache(cache_size)
+
+        # Pooled mode, see enable_pooling
+        self.read_pool = None
+        self.writer = None
+        self.read_connections = []
+        self.thread_local = threading.local()
+
+        # Shared mode, see enable_shared_access
+        self.shared_access = False
+        self.data_version = None
+
     def close(self):
+        if self.writer:
+            self.writer.close()
+        if self.read_pool:
+            self.read_pool.shutdown(wait=True)
+        for connection in self.read_connections:
+            connection.close()
+        if self.db_thread:
+            self.db_thread.shutdown(wait=True)
         self.connection.close()
 
+    def enable_pooling(self, read_connections=4, commit_latency=0.0, commit_batch_size=64):
+        """
+        Switches the async methods to the pooled mode: WAL journal, a pool of read-only connections (one per reader thread)
+        and a single GroupCommitWriter that owns self.connection. The sync methods must not be used after this call.
+        """
+        if self.db_name == ":memory:":
+            raise ValueError("Pooled mode needs a database file, it can't be used with an in-memory database")
+
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA busy_timeout = 5000")
+        self.read_pool = ThreadPoolExecutor(max_workers=read_connections, thread_name_prefix="sqlite-reader",
+                                            initializer=self._open_read_connection)
+        self.writer = GroupCommitWriter(self.connection, commit_latency, commit_batch_size)
+
+    def enable_shared_access(self, busy_timeout_ms=5000):
+        """
+        For several processes using the same database file (--workers): WAL journal, so the readers don't block the writer,
+        busy timeout, so a write waits for the other processes' ones instead of failing, and the cache is dropped
+        whenever another process commits (see sync_cache).
+        """
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute(f"PRAGMA busy_timeout = {busy_timeout_ms}")
+        self.data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        self.shared_access = True
+
+    @staticmethod
+    def _data_version(connection) -> int:
+        # PRAGMA data_version of the connection that does the writes changes only with the commits of the other connections
+        # (processes) - this process' own commits invalidate exactly the rows they change
+        return connection.execute("PRAGMA data_version").fetchone()[0]
+
+    async def sync_cache(self):
+        """In the shared mode, drops the cached rows if another process changed the database since the last check"""
+        if not self.shared_access:
+            return
+        if self.writer:
+            version = await asyncio.wrap_future(self.writer.call(self._data_version))
+        else:
+            version = await self.run_async(self._data_version, self.connection)
+        # The cache is only touched on the event loop, the DB threads just read the version
+        if version != self.data_version:
+            self.data_version = version
+            self.cache.clear()
+
+    def _open_read_connection(self):
+        uri = pathlib.Path(self.db_name).absolute().as_uri() + "?mode=ro"
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.set_trace_callback(count_statement)
+        connection.execute("PRAGMA busy_timeout = 5000")
+        self.read_connections.append(connection)
+        self.thread_local.connection = connection
+
     def execute_read(self, query, params=None) -> sqlite3.Cursor:
         cursor = self.connection.cursor()
         if params:
@@ -20,91 +403,190 @@ class Database:
             cursor.execute(query)
         return cursor
     
-    def execute_write(self, query, params=None):
+    def execute_write(self, query, params=None) -> int:
         cursor = self.connection.cursor()
         if params:
             cursor.execute(query, params)
         else:
             cursor.execute(query)
         self.connection.commit()
+        return cursor.lastrowid
+
+    async def run_async(self, function, *args):
+        if self.db_thread is None:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.db_thread, contextvars.copy_context().run, function, *args)
+
+    def _read(self, query, params, fetch_all):
+        # In the pooled mode every reader thread uses its own read-only connection
+        connection = getattr(self.thread_local, "connection", self.connection)
+        start = time.perf_counter()
+        cursor = connection.execute(query, params or ())
+        result = cursor.fetchall() if fetch_all else cursor.fetchone()
+        QUERY_DURATION.observe(time.perf_counter() - start, "read")
+        ROWS_RETURNED.observe(len(result) if fetch_all else int(result is not None))
+        return result
+
+    @staticmethod
+    @contextlib.contextmanager
+    def count_queries():
+        """Counts the SQL statements run by the async methods within the block (and in the tasks it spawns)"""
+        counter = QueryCounter()
+        token = current_query_counter.set(counter)
+        try:
+            yield counter
+        finally:
+            current_query_counter.reset(token)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def record_statements():
+        """Records the SQL statements (with their parameters bound) run by the async methods within the block"""
+        statements = []
+        token = current_statement_log.set(statements)
+        try:
+            yield statements
+        finally:
+            current_statement_log.reset(token)
+
+    async def read_all(self, query, params=None) -> list[sqlite3.Row]:
+        if self.read_pool:
+            return await asyncio.get_running_loop().run_in_executor(self.read_pool, contextvars.copy_context().run, self._read, query, params, True)
+        return await self.run_async(self._read, query, params, True)
+
+    async def read_with(self, function):
+        """Runs function(connection) on a read connection, for the reads too big to be fetched at once (e.g. streamed hashes)"""
+        if self.read_pool:
+            return await asyncio.get_running_loop().run_in_executor(self.read_pool, contextvars.copy_context().run, self._read_with, function)
+        return await self.run_async(self._read_with, function)
+
+    def _read_with(self, function):
+        return function(getattr(self.thread_local, "connection", self.connection))
+
+    async def read_one(self, query, params=None) -> sqlite3.Row | None:
+        if self.read_pool:
+            return await asyncio.get_running_loop().run_in_executor(self.read_pool, contextvars.copy_context().run, self._read, query, params, False)
+        return await self.run_async(self._read, query, params, False)
+
+    async def read_row(self, table, id) -> sqlite3.Row | None:
+        """Reads a row by its primary key through the cache"""
+        await self.sync_cache()
+        row = self.cache.get(table, id)
+        if row is not None:
+            return row
+        generation = self.cache.generation(table)
+        row = await self.read_one(f"SELECT * FROM {table} WHERE id = ?", (id,))
+        if row is not None:
+            self.cache.put(table, id, row, generation)
+        return row
+
+    async def cached_row(self, table, id) -> sqlite3.Row | None:
+        """The row if it's cached already, without reading the DB (and without counting a cache lookup)"""
+        await self.sync_cache()
+        return self.cache.peek(table, id)
+
+    def _run_transaction(self, function):
+        try:
+            # Takes the write lock upfront, so the function's reads and writes see no other process' commits in between
+            self.connection.execute("BEGIN IMMEDIATE")
+            start = time.perf_counter()
+            result = function(self.connection)
+            QUERY_DURATION.observe(time.perf_counter() - start, "transaction")
+            start = time.perf_counter()
+            self.connection.commit()
+            COMMIT_DURATION.observe(time.perf_counter() - start)
+            return result
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    async def transaction(self, function):
+        """Runs function(connection) atomically - either all of its writes are committed, or none of them"""
+        if self.writer:
+            return await asyncio.wrap_future(self.writer.submit(function))
+        return await self.run_async(self._run_transaction, function)
+
+    async def write(self, query, params=None) -> int:
+        """Executes and commits a write, returns the lastrowid"""
+        return await self.transaction(lambda connection: connection.execute(query, params or ()).lastrowid)
 
     def init_db(self, force=False):
+        """Applies the pending MIGRATIONS, force re-applies all of them"""
         self.connection.execute("PRAGMA foreign_keys = ON")
-        cursor = self.connection.cursor()
 
-        cursor.execute("""
-            SELECT name FROM sqlite_master
-            WHERE type='table' AND name='characters';
-        """)
-        if not force and cursor.fetchone():
+        version = 0 if force else self.schema_version()
+        pending = [migration for migration in MIGRATIONS if migration[0] > version]
+        if not pending:
             print("Database already initialized.")
             return
 
         print("Initializing or updating database")
 
-        cursor.executescript("""
-        CREATE TABLE IF NOT EXISTS location (
-            id INTEGER PRIMARY KEY,
-            name VARCHAR,
-            description TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS characters (
-            id INTEGER PRIMARY KEY,
-            name VARCHAR,
-            class VARCHAR,
-            race VARCHAR,
-            hitpoints INTEGER
-        );
-
-        CREATE TABLE IF NOT EXISTS items (
-            id INTEGER PRIMARY KEY,
-            owner_id INTEGER,
-            name VARCHAR,
-            type VARCHAR,
-            functional_descr TEXT,
-            hitpoint_impact INTEGER,
-            rarity INTEGER,
-            FOREIGN KEY(owner_id) REFERENCES characters(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS enemies (
-            id INTEGER PRIMARY KEY,
-            name VARCHAR,
-            description TEXT,
-            hitpoints INTEGER,
-            base_damage INTEGER,
-            spawn_location INTEGER,
-            FOREIGN KEY(spawn_location) REFERENCES location(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS npc (
-            id INTEGER PRIMARY KEY,
-            name VARCHAR,
-            description TEXT,
-            information_to_give TEXT,
-            quest_to_give TEXT,
-            spawn_location INTEGER,
-            reward_id INTEGER,
-            FOREIGN KEY(spawn_location) REFERENCES location(id),
-            FOREIGN KEY(reward_id) REFERENCES items(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS loot (
-            enemy_id INTEGER,
-            item_id INTEGER,
-            PRIMARY KEY (enemy_id, item_id),
-            FOREIGN KEY(enemy_id) REFERENCES enemies(id),
-            FOREIGN KEY(item_id) REFERENCES items(id)
-        );
-        """)
+        for version, description, script in pending:
+            print(f"Applying migration {version}: {description}")
+            try:
+                # Every migration is atomic - its changes and the version bump are committed together
+                self.connection.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+            except Exception:
+                if self.connection.in_transaction:
+                    self.connection.rollback()
+                raise
 
-        self.connection.commit()
         print("Database initialized successfully.")
 
+    def schema_version(self) -> int:
+        return self.connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def full_table_scans(self, query, params=None) -> list[str]:
+        """Returns the full table scans (EXPLAIN QUERY PLAN "SCAN ..." steps) the query would do"""
+        plan = self.connection.execute(f"EXPLAIN QUERY PLAN {query}", params or ()).fetchall()
+        return [row['detail'] for row in plan if row['detail'].startswith("SCAN")]
+
     def soft_restart_db(self):
-        self.clear_db()
-        self.populate_db()
+        """Restores the pristine world from the template database with the SQLite online backup API"""
+        template = sqlite3.connect(self.build_template())
+        template.backup(self.connection)
+        template.close()
+        self.cache.clear()
+
+    def template_path(self) -> str:
+        root, extension = os.path.splitext(self.db_name)
+        return f"{root}.template{extension or '.db'}"
+
+    @staticmethod
+    @functools.cache
+    def world_fingerprint() -> int:
+        # Changes whenever the schema or the default campaign does, so stale templates get rebuilt
+        checksum = zlib.crc32(repr(MIGRATIONS).encode())
+        with open(DEFAULT_CAMPAIGN, "rb") as file:
+            while chunk := file.read(1024 * 1024):
+                checksum = zlib.crc32(chunk, checksum)
+        return checksum & 0x7FFFFFFF
+
+    def build_template(self, rebuild=False) -> str:
+        """Builds the pristine world (schema + the default campaign) into the template database file, unless an up-to-date one exists"""
+        path = self.template_path()
+        fingerprint = self.world_fingerprint()
+
+        if not rebuild and os.path.exists(path):
+            template = sqlite3.connect(path)
+            application_id = template.execute("PRAGMA application_id").fetchone()[0]
+            template.close()
+            if application_id == fingerprint:
+                return path
+
+        print("Building the template database")
+        temporary_path = path + ".tmp"
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        template = Database(db_name=temporary_path, use_db_thread=False)
+        template.populate_db()
+        template.connection.execute(f"PRAGMA application_id = {fingerprint}")
+        template.connection.commit()
+        template.close()
+        # Atomic, so a concurrently starting server never reads half of a template
+        os.replace(temporary_path, path)
+        return path
 
     def remove_tables_from_db(self):
         cursor = self.connection.cursor()
@@ -114,6 +596,7 @@ class Database:
         cursor.execute("DROP TABLE location")
         cursor.execute("DROP TABLE items")
         cursor.execute("DROP TABLE characters")
+        cursor.execute("PRAGMA user_version = 0")
         self.connection.commit()
         print("Database tables removed successfully.")
 
@@ -128,194 +611,6 @@ class Database:
         self.connection.commit()
         print("Database cleared successfully.")
 
-    def populate_db(self):
-        self.cursor.executemany("INSERT INTO location (id, name, description) VALUES (?, ?, ?)", [
-            (0, "Creekwood Village", "A small village on the outskirts of the town, few peasant houses and large bailiff's house."),
-            (1, "Frost Mountains", "Icy peaks and howling wind. Treacherous snowy paths lead to dozens of shallow caves."),
-            (2, "Black Forest", "Dark, dense forest of pine trees, overgrown with vines. Predatory eyes lurk within every distant shadow."),
-            (3, "Ancient Ruins", "Old limestone stone structures covered in moss, remnants of rectangular structure, floor is lower than surroundings, maybe an old bath house. The air is thick and musty."),
-            (4, "Miller's Town", "Rich merchant town, placed on the crossroads. Bustling markets, shady alleyways and many with pursers to heavy. Perfect place for quest gathering."),
-        ])
-
-        self.cursor.executemany("INSERT INTO characters (id, name, class, race, hitpoints) VALUES (?, ?, ?, ?, ?)", [
-            (0, "Tharion The Missing Star", "Flexible Ranger", "Elf", 90),
-            (1, "Brugdurk Harimson", "Strictly Melee Focused Warrior", "Dwarf", 120),
-            (2, "Sweetberry Pillover", "Mage", "Gnome", 70),
-        ])
-
-        self.cursor.executemany("INSERT INTO items (id, owner_id, name, type, functional_descr, hitpoint_impact, rarity) VALUES (?, ?, ?, ?, ?, ?, ?)", [
-            # Staring items for characters
-            (0, 0, "Crooked Bow", "Ranged Weapon", "Second hand bow, slightly wobbly", 13, 8),
-            (1, 1, "Dagger", "Single Handed Melee Weapon", "Simple iron dagger", 15, 8),
-            (2, 2, "Silver Spoon", "Magic Weapon", "Magic infused silver spoon, allegedly...", 18, 6),
-            (3, 0, "Weak Healing Potion", "Healing Item", "Heals 20 HP", 20, 9),
-            (4, 1, "Weak Healing Potion", "Healing Item", "Heals 20 HP", 20, 9),
-            (5, 2, "Weak Healing Potion", "Healing Item", "Heals 20 HP", 20, 9),
-            # Items for enemies
-            (6, None, "Frost Troll's Claw", "Two Handed Melee Weapon", "A large claw from a Frost Troll, sharp and icy, might be used as a club", 60, 2),
-            (7, None, "A weird Crown", "Magical Weapon", "Made of pure gold and black stones. If feels like it's whispering secrets", 65, 1),
-            (8, None, "Large Egg", "Healing Item", "Must be a Harpy future child", 100, 2),
-            (9, None, "A Large Feather", "Quest Item", "Harpy feather. Stripped and long as an arm", None, 3),
-            (10, None, "White Pelt", "Armor Item", "Trophy, provides some protection from cold", 20, 3),
-            (11, None, "Silver Tooth", "Quest Item", "Tooth of a Snow Silvertooth Tiger", None, 2),
-            (12, None, "Dragon's Eye", "Quest Item", "Eye of a Dragon", None, 1),
-            (13, None, "Black Steel Armour", "Armor Item", "Legendary armour, harder than anything", 60, 1),
-            (14, None, "Spine Bow", "Ranged Weapon", "Spine Bow", 80, 1),
-
-            (15, None, "Expired Healing Potion", "Healing Item", "Expired Healing Potion, smells bad but should work", 30, 8),
-            (16, None, "Expired Healing Potion", "Healing Item", "Expired Healing Potion, smells bad but should work", 30, 8),
-            (17, None, "Short Bow", "Ranged Weapon", "Simple short bow, made by humans", 25, 7),
-            (18, None, "Expired Healing Potion", "Healing Item", "Expired Healing Potion, smells bad but should work", 30, 8),
-            (19, None, "Boar Spear", "Single Handed Melee Weapon", "Spear designed for hunting", 20, 7),
-            (20, None, "Druid Staff", "Magical Weapon", "Staff made from ancient red wood, enhances magical abilities", 35, 5),
-            (21, None, "Woodbark cuirass", "Armor Item", "Cuirass made from the bark of ancient trees, light, durable and flammable", 5, 6),
-            (22, None, "Lich-Witch head", "Quest Item", "Disgusting", None, 3),
-            (23, None, "Protective Coil", "Shield Item", "A magical shield, wraps around the weaker arm", 8, 5),
-            (24, None, "Black goblin's head", "Quest Item", "Disgusting", 20, 7),
-            (25, None, "Heavy Scimitar", "Two Handed Melee Weapon", "Curved blade", 32, 7),
-
-            (26, None, "Lotus Flower", "Healing Item", "Legend has it that this flower restores health", 80, 2),
-            (27, None, "Gladius", "Single Handed Melee Weapon", "Short sword, designed for quick strikes", 35, 6),
-            (28, None, "Round Shield", "Shield Item", "Old wooden shield, still sturdy", 14, 7),
-            (29, None, "Fire Breathing Bow", "Ranged Weapon", "A bow that sets arrows on fire, origin unknown", 40, 4),
-            (30, None, "Soul of the Ancient Spirit", "Quest Item", "A fragment of a powerful spirit, pulsating with energy", None, 2),
-            (31, None, "Orb's Essence", "Quest Item", "Raw magic energy", None, 3),
-            (32, None, "Book of Cursed Secrets", "Magic Weapon", "I can not tell you more, it is a secret", 45, 4),
-
-            (33, None, "Mercy", "Single Handed Melee Weapon", "A long dagger", 22, 7),
-            (34, None, "Chain mail", "Armor Item", "Standard issue chain mail armor", 10, 6),
-            # Items for NPCs
-            (35, None, "Longsword", "Single Handed Melee Weapon", "A versatile sword", 26, 6),
-            (36, None, "Medium Healing Potion", "Healing Item", "A potion that restores a moderate amount of health", 50, 6),
-            (37, None, "Gold Hoard", "Misc Item", "Heaps of gold coins, you can retire now", None, 10),
-            (38, None, "Mega Elixir", "Healing Item", "Does wonders", 200, 1),
-            (39, None, "Huge Sword", "Two Handed Melee Weapon", "Some would say it is not a sword but a slab of iron.", 50, 2),
-            (40, None, "Lance of the Light", "Single Handed Melee Weapon", "A shiny lance, imbued with the power of The Light", 45, 2),
-            (41, None, "Dwarven Plate Armor", "Armor Item", "A heavy armor, favored by dwarven warriors", 15, 2),
-        ])
-
-        self.cursor.executemany("INSERT INTO enemies (id, name, description, hitpoints, base_damage, spawn_location) VALUES (?, ?, ?, ?, ?, ?)", [
-            # Enemies in Creekwood Village
-            (0, "Young Wasp", "insect with a painful sting, no larger than fist", 10, 5, 0),
-            (1, "Muddy Slime", "Dark blob of water and dirt silently sitting in a forgotten bucket", 25, 2, 0),
-            # Enemies in Frost Mountains
-            (2, "Frost Troll", "Large icy creature with blue fur", 120, 40, 1),
-            (3, "Frost Troll", "Large icy creature with blue fur", 120, 40, 1),
-            (4, "Harpy", "Bird-like creature with a woman's face", 40, 20, 1),
-            (5, "Snow Silvertooth Tiger", "Large feline with white fur and silver stripes", 100, 25, 1),
-            (6, "Old Dragon", "Ancient, furious dragon, his limbs and wings suffer from frostbite", 600, 55, 1),
-            # Enemies in Black Forest
-            (7, "Ugly Goblin", "A pitiful creature, still, it wants your blood", 30, 10, 2),
-            (8, "Ugly Goblin", "A pitiful creature, still, it wants your blood", 30, 10, 2),
-            (9, "Ugly Goblin", "A pitiful creature, still, it wants your blood", 30, 10, 2),
-            (10, "Forest Spirit", "This tree moves!", 50, 15, 2),
-            (11, "Forest Spirit", "This tree moves!", 50, 15, 2),
-            (12, "Lich-Witch", "Undead spellcaster, draws power out of living things, leaving gray and dry path behind", 75, 20, 2),
-            (13, "Black Goblin", "Short and vicious, smells of vomit", 44, 22, 2),
-            # Enemies in Ancient Ruins
-            (14, "Stone Golem", "Large creature, made of rubble, sleeps", 200, 33, 3),
-            (15, "Husk of the warrior", "An undead, his worn armor rest on remains of his flesh and bones.", 70, 23, 3),
-            (16, "Husk of the warrior", "An undead, his worn armor rest on remains of his flesh and bones.", 70, 23, 3),
-            (17, "Ancient Spirit", "A ghostly figure that haunts the ruins, screams painfully when attacked", 62, 37, 3),
-            (18, "Orb", "Floating magical essence, irritated", 80, 25, 3),
-            (19, "Ordinary Chest", "A ornate wooden chest, it is a Mimic (secret!)", 30, 40, 3),
-            # Enemies in Miller's Town
-            (20, "Thief", "A sneaky bastard looking for easy prey", 80, 15, 4),
-            (21, "Racketeer", "A man with too many scars to call his face a face. Mugs people on daily basis", 90, 20, 4),
-        ])
-
-        self.cursor.executemany("INSERT INTO loot (enemy_id, item_id) VALUES (?, ?)", [
-            # Frost Troll - Frost Troll's Claw
-            (2, 6),
-            # Frost Troll - A weird Crown
-            (3, 7),
-            # Harpy - Large Egg
-            (4, 8),
-            # Harpy - A Large Feather
-            (4, 9),
-            # Snow Silvertooth Tiger - White Pelt
-            (5, 10),
-            # Snow Silvertooth Tiger - Silver Tooth
-            (5, 11),
-            # Old Dragon - Dragon's Eye
-            (6, 12),
-            # Old Dragon - Black Steel Armour
-            (6, 13),
-            # Old Dragon - Spine Bow
-            (6, 14),
-
-            # Ugly Goblin - Expired Healing Potion
-            (7, 15),
-            # Ugly Goblin - Expired Healing Potion
-            (8, 16),
-            # Ugly Goblin - Short Bow
-            (8, 17),
-            # Ugly Goblin - Expired Healing Potion
-            (9, 18),
-            # Ugly Goblin - Boar Spear
-            (9, 19),
-            # Forest Spirit - Druid Staff
-            (10, 20),
-            # Forest Spirit - Woodbark cuirass
-            (11, 21),
-            # Lich-Witch - Lich-Witch head
-            (12, 22),
-            # Lich-Witch - Protective Coil
-            (12, 23),
-            # Black Goblin - Black goblin's head
-            (13, 24),
-            # Black Goblin - Heavy Scimitar
-            (13, 25),
-
-            # Stone Golem - Lotus Flower
-            (14, 26),
-            # Husk of the warrior - Gladius
-            (15, 27),
-            # Husk of the warrior - Round Shield
-            (15, 28),
-            # Husk of the warrior - Fire Breathing Bow
-            (16, 29),
-            # Ancient Spirit - Soul of the Ancient Spirit
-            (17, 30),
-            # Orb - Orb's Essence
-            (18, 31),
-            # Ordinary Chest (Mimic) - Book of Cursed Secrets
-            (19, 32),
-
-            # Thief - Mercy
-            (20, 33),
-            # Racketeer - Chain mail
-            (21, 34),
-        ])
-
-        self.cursor.executemany("INSERT INTO npc (id, name, description, information_to_give, quest_to_give, spawn_location, reward_id) VALUES (?, ?, ?, ?, ?, ?, ?)", [
-            # Quest givers in Creekwood Village
-            (0, "Elder Elwyn", "Old man dressed in high quality robes", "If I were you, I would not go further than the forest with a weak equipment", 
-             "Kill the goblin band leader - The black goblin, that will show them",
-             0, 35),
-            (1, "Mirinda, Apprentice", "Young elf, a novice priestes of The Light, troubled with suffering of the people",
-                "Magical creatures might hold power useful for the sages", "Help the village and get rid of the foul Lich-Witch from Black Forest, Beware as this is a powerful creature",
-                0, 36),
-            # Flavor NPC's in Creekwood Village
-            (2, "Stupid Joe", "Middle aged gnome with uneven mustache", "One time I drank 5 potions at once, since then I can't see people's skins. You have a very nice flesh", None, 0, None),
-            (3, "Fishermen Brad", "Young dwarf, with a fishing rod and a big belly. His beard is split in two braids", 
-             "You can test your combat skills on some creatures around the village. I think I've heard that drinking potions increases your vitality over your current limits", None, 0, None),
-            # Quest givers in Miller's Town
-            (4, "Merchant Billy", "A human, dressed in fine clothes and with a confident demeanor", "Frost Mountains are extremely dangerous, no way I can go there, but You..",
-             "Bring me a Dragon's Eye, I will reward you handsomely, you will become richer than kings", 4, 37),
-            (5, "Tavern Keeper Elissa", "A lizard folk with a friendly smile", "For the last time, this is a tavern not a place to rest, you drink, not sleep",
-             "Bring me Silver Tooth from a large feline, I need it for a special brew, I will reward you with strong concoction", 4, 38),
-            (6, "Urchin", "A dirty child with a mischievous grin", "Better watch your back and don't go into alleys if you dont want to get stabbed, heh",
-             "Bring me a large feather, like from harpy or something, I give you a big weapon in exchange, its useless for me", 4, 39),
-            (7, "Elder Sage of The Order of Sage Elders", "You can see only the cloak and darkness beneath",
-             "...", "Slay an Ancient One in the Ruins, bring me the soul of the defeated, obey my command", 4, 40),
-            (8, "Guard Captain Ed", "Half elf with a stern expression", "Ancient ruins are restless recently, if you can handle the danger of Dark Forest, maybe you can survive in Ruins too",
-             "Destroy the magical Orb in Ancient ruins, it disturbs the spirits I think, I need an Orb essence as a confirmation.", 4, 41),
-            # Flavor NPC's in Miller's Town
-            (9, "Drunk", "Old elf with a glowing staff", "Heer i ee wfuu.. nell, kep lossing erifiing [more drunk rumbling]", None, 4, None),
-            (10, "A noble", "Old elf with a regal bearing", "D o n t  t o u c h  m e, p e a s a n t", None, 4, None),
-        ])
-
-        self.connection.commit()
-        print("Database initialized successfully.")
-        pass
+    def populate_db(self, campaign=DEFAULT_CAMPAIGN):
+        """Fills the world with the campaign's content (see world_io.py), the hand made world by default"""
+        import_world(self.connection, campaign)
@@ -0,0 +1,47 @@
+import json
+
+# Output formats of the tools' responses:
+# - prose - the verbose "Item's name: ..., Item's id (secret): ..." sentences, one line per row (default)
+# - compact - a "label: column|column|..." header line and one "value|value|..." line per row
+# - json - minified JSON, {"label": [{"column": value, ...}, ...]}
+OUTPUT_FORMATS = ("prose", "compact", "json")
+
+CHARACTER_COLUMNS = ("id", "name", "class", "race", "hitpoints")
+LOCATION_COLUMNS = ("id", "name", "description")
+ENEMY_COLUMNS = ("id", "name", "description", "hitpoints", "base_damage", "spawn_location")
+NPC_COLUMNS = ("id", "name", "description", "information_to_give", "quest_to_give", "reward_id", "spawn_location")
+ITEM_COLUMNS = ("id", "name", "type", "functional_descr", "hitpoint_impact", "rarity", "owner_id")
+COMBAT_OUTCOME_COLUMNS = ("character_id", "character_name", "weapon", "enemy_id", "enemy_name", "damage_dealt", "enemy_hitpoints",
+                          "enemy_defeated", "damage_taken", "character_hitpoints", "character_dead")
+# The static part of an item, without its current owner
+CATALOG_ITEM_COLUMNS = ("id", "name", "type", "functional_descr", "hitpoint_impact", "rarity")
+# For the rows of a single location, where the spawn location is known already
+LOCAL_ENEMY_COLUMNS = ("id", "name", "description", "hitpoints", "base_damage")
+LOCAL_NPC_COLUMNS = ("id", "name", "description", "information_to_give", "quest_to_give", "reward_id")
+# The paged "all" queries end with this section - the rows in the table and the cursor of the next page (empty on the last one)
+PAGE_COLUMNS = ("total", "next_cursor")
+
+def compact_value(value) -> str:
+    # The delimiter and new lines would break the row apart
+    if value is None:
+        return ""
+    return str(value).replace("|", "/").replace("\n", " ")
+
+def render_sections(sections, output_format) -> str:
+    """
+    Renders the sections - (label, rows, columns) tuples - in the compact or the json format.
+    The rows can be sqlite3.Row objects or dicts, only the given columns are rendered.
+    """
+    if output_format == "json":
+        return json.dumps({label: [{column: row[column] for column in columns} for row in rows]
+                           for label, rows, columns in sections}, separators=(",", ":"))
+
+    lines = []
+    for label, rows, columns in sections:
+        lines.append(f"{label}: " + "|".join(columns))
+        for row in rows:
+            lines.append("|".join(compact_value(row[column]) for column in columns))
+    return "\n".join(lines) + "\n"
+
+def render_rows(label, rows, columns, output_format) -> str:
+    return render_sections([(label, rows, columns)], output_format)
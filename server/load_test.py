@@ -0,0 +1,105 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from collections import defaultdict
+
+from fastmcp import Client
+
+# TERMINAL
+# For instance: python.exe load_test.py --url http://127.0.0.1:8080/mcp --sessions 50
+# Drives a running server.py with simulated players over streamable HTTP, no LLM involved, and reports the throughput and
+# the latency and error rate of every tool. The players change the world, so run the server with --soft_restart_db
+# (or --per_session_worlds, then every simulated player gets its own world)
+
+class ToolStats:
+    def __init__(self):
+        self.latencies = defaultdict(list) # tool -> seconds of every call
+        self.errors = defaultdict(int) # tool -> failed calls (raised, isError, DB Error or World expired response)
+
+async def call(client, stats, tool, arguments) -> str:
+    start = time.perf_counter()
+    try:
+        result = await client.call_tool(tool, arguments, raise_on_error=False)
+        text = result.content[0].text if result.content else ""
+        if result.is_error or text.startswith(("DB Error:", "World expired:")):
+            stats.errors[tool] += 1
+        return text
+    except Exception:
+        stats.errors[tool] += 1
+        return ""
+    finally:
+        stats.latencies[tool].append(time.perf_counter() - start)
+
+def json_rows(text, label) -> list[dict]:
+    try:
+        return json.loads(text)[label]
+    except (ValueError, KeyError, TypeError):
+        return []
+
+async def player(url, player_id, rounds, stats, seed):
+    # A scripted player: creates a character, looks around, fights (HP updates) and picks up the loot
+    rng = random.Random(seed * 100000 + player_id)
+    async with Client(url) as client:
+        response = await call(client, stats, "create_and_add_new_character",
+                              {"name": f"Load Tester {player_id}", "class_name": rng.choice(["Warrior", "Mage", "Rogue"]),
+                               "race": rng.choice(["Human", "Elf", "Dwarf"]), "hitpoints": 100})
+        match = re.search(r"Character ID is: (\d+)", response)
+        if not match:
+            return
+        character_id = int(match.group(1))
+
+        for _ in range(rounds):
+            locations = json_rows(await call(client, stats, "query_locations", {"action": "all", "output_format": "json"}), "locations")
+            location_id = rng.choice(locations)["id"] if locations else 0
+            await call(client, stats, "describe_location_snapshot", {"location_id": location_id, "output_format": "compact"})
+
+            enemies = json_rows(await call(client, stats, "get_alive_enemies_in_location",
+                                           {"location_id": location_id, "output_format": "json"}), "enemies")
+            if enemies:
+                enemy = rng.choice(enemies)
+                await call(client, stats, "get_enemy_info_by_id", {"enemy_id": enemy["id"]})
+                await call(client, stats, "update_enemy_hitpoints", {"enemy_id": enemy["id"], "new_hitpoints": rng.randint(1, 100)})
+                await call(client, stats, "update_character_hitpoints", {"id": character_id, "hitpoints": rng.randint(1, 100)})
+
+                loot = json_rows(await call(client, stats, "get_loot_items_from_enemy",
+                                            {"enemy_id": enemy["id"], "output_format": "json"}), "loot")
+                if loot:
+                    await call(client, stats, "assign_item_to_character_equipment",
+                               {"item_id": rng.choice(loot)["id"], "character_id": character_id})
+
+            await call(client, stats, "get_characters_equipment", {"character_id": character_id, "output_format": "compact"})
+
+def print_report(stats, duration):
+    total_calls = sum(len(latencies) for latencies in stats.latencies.values())
+    total_errors = sum(stats.errors.values())
+    print(f"{total_calls} tool calls in {duration:.1f} s: {total_calls / duration:.1f} calls / s, "
+          f"errors: {total_errors} ({total_errors / max(1, total_calls):.1%})")
+    print(f"{'tool':<38}{'calls':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for tool, latencies in sorted(stats.latencies.items()):
+        if len(latencies) > 1:
+            cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = latencies[0]
+        print(f"{tool:<38}{len(latencies):>8}{stats.errors[tool]:>8}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}{p99 * 1000:>10.2f}")
+
+async def load_test(args):
+    stats = ToolStats()
+    start = time.perf_counter()
+    await asyncio.gather(*(player(args.url, player_id, args.rounds, stats, args.seed) for player_id in range(args.sessions)))
+    print_report(stats, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8080/mcp"), help='URL of the MCP server (default MCP_SERVER_URL)')
+    parser.add_argument('--sessions', type=int, default=20, help='Number of concurrent simulated players (MCP sessions)')
+    parser.add_argument('--rounds', type=int, default=5, help='Rounds of the scripted sequence played by every player')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the players\' choices')
+    args = parser.parse_args()
+
+    asyncio.run(load_test(args))
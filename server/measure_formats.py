@@ -0,0 +1,62 @@
+import os
+import asyncio
+import tempfile
+
+from database import Database
+from formatting import OUTPUT_FORMATS
+import server
+
+# TERMINAL
+# For instance: python.exe measure_formats.py
+# Prints the size (bytes and estimated tokens) of every read tool's response in every output format
+
+try:
+    import tiktoken
+    encoding = tiktoken.get_encoding("o200k_base")
+    def estimate_tokens(text) -> int:
+        return len(encoding.encode(text))
+except ImportError:
+    def estimate_tokens(text) -> int:
+        # The usual rule of thumb for English text, when tiktoken isn't installed
+        return (len(text) + 3) // 4
+
+# (tool, kwargs) - the read tools with results typical for a turn of the game
+TOOL_CALLS = [
+    (server.query_playable_characters, {"action": "all"}),
+    (server.query_playable_characters, {"action": "by_id", "id": 0}),
+    (server.query_locations, {"action": "all"}),
+    (server.query_locations, {"action": "by_id", "id": 1}),
+    (server.describe_location_snapshot, {"location_id": 1}),
+    (server.get_alive_enemies_in_location, {"location_id": 2}),
+    (server.get_enemy_info_by_id, {"enemy_id": 6}),
+    (server.get_npcs_in_location, {"location_id": 4}),
+    (server.get_npc_info_by_id, {"npc_id": 4}),
+    (server.get_item_by_id, {"item_id": 13}),
+    (server.get_loot_items_from_enemy, {"enemy_id": 6}),
+    (server.get_quest_reward_item, {"npc_id": 4}),
+    (server.get_characters_equipment, {"character_id": 0}),
+]
+
+async def measure_formats():
+    print(f"{'tool':<48}" + "".join(f"{output_format + ' B/tok':>18}" for output_format in OUTPUT_FORMATS))
+    totals = {output_format: [0, 0] for output_format in OUTPUT_FORMATS}
+    for tool, kwargs in TOOL_CALLS:
+        line = f"{tool.__name__ + str(tuple(kwargs.values())):<48}"
+        for output_format in OUTPUT_FORMATS:
+            response = await tool(**kwargs, output_format=output_format)
+            size, tokens = len(response.encode()), estimate_tokens(response)
+            totals[output_format][0] += size
+            totals[output_format][1] += tokens
+            line += f"{f'{size}/{tokens}':>18}"
+        print(line)
+
+    prose_tokens = totals["prose"][1]
+    print(f"{'total':<48}" + "".join(f"{f'{size}/{tokens}':>18}" for size, tokens in totals.values()))
+    print(f"{'tokens vs prose':<48}" + "".join(f"{f'{tokens / prose_tokens:.0%}':>18}" for _, tokens in totals.values()))
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        server.db = Database(db_name=os.path.join(directory, "measure_formats.db"))
+        server.db.soft_restart_db()
+        asyncio.run(measure_formats())
+        server.db.close()
@@ -0,0 +1,123 @@
+import bisect
+import threading
+
+# Minimal Prometheus metrics (text exposition format 0.0.4), served by the server's /metrics endpoint.
+# The DB threads update them concurrently with the event loop, so every metric has its own lock.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_labels(names, values, extra="") -> str:
+    labels = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = {} # label values tuple -> value
+        self.lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            values = sorted(self.values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            # [count per bucket (not cumulative)..., +Inf bucket, sum]
+            state = self.values.setdefault(label_values, [0] * (len(self.buckets) + 1) + [0.0])
+            state[bisect.bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            values = sorted((label_values, list(state)) for label_values, state in self.values.items())
+        for label_values, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                labels = format_labels(self.label_names, label_values, f'le="{format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+TOOL_CALLS = REGISTRY.register(Counter("rpg_tool_calls_total", "Number of MCP tool calls", ("tool",)))
+TOOL_ERRORS = REGISTRY.register(Counter("rpg_tool_errors_total", "Number of MCP tool calls that failed (raised or returned a DB Error)", ("tool",)))
+TOOL_DURATION = REGISTRY.register(Histogram("rpg_tool_duration_seconds", "Duration of the MCP tool calls", ("tool",)))
+TOOLS_IN_FLIGHT = REGISTRY.register(Gauge("rpg_tool_calls_in_flight", "Number of MCP tool calls being served", ("tool",)))
+
+# operation: "read" (a query on a read connection) or "transaction" (the statements of a write, without the commit)
+QUERY_DURATION = REGISTRY.register(Histogram("rpg_sqlite_query_duration_seconds", "Time spent running SQLite statements", ("operation",)))
+COMMIT_DURATION = REGISTRY.register(Histogram("rpg_sqlite_commit_duration_seconds", "Time spent committing SQLite transactions"))
+ROWS_RETURNED = REGISTRY.register(Histogram("rpg_sqlite_rows_returned", "Number of rows returned by a read", buckets=ROW_BUCKETS))
+
+# The RowCache of the static rows (of every world): lookups by result ("hit" or "miss"), and the cached rows, set on every scrape
+ROW_CACHE_LOOKUPS = REGISTRY.register(Counter("rpg_row_cache_lookups_total", "Number of row cache lookups", ("result",)))
+ROW_CACHE_ROWS = REGISTRY.register(Gauge("rpg_row_cache_rows", "Number of rows in the row caches"))
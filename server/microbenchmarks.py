@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import statistics
+
+from database import Database
+from worldgen import generate_world
+import server
+
+# TERMINAL
+# For instance: python.exe microbenchmarks.py run --output baseline.json
+#               python.exe microbenchmarks.py run --output current.json
+#               python.exe microbenchmarks.py compare baseline.json current.json --threshold 0.1
+# Calls every tool coroutine directly (no HTTP, no MCP) against worlds of 10, 10k and 1M rows per table and stores the
+# per call timings as JSON; compare exits with 1 when any tool got slower than the baseline by more than the threshold
+
+def scaled_world(path, rows, seed=0) -> Database:
+    """A generated world with the given number of characters, items and enemies, rows // 10 NPCs and rows // 100 locations"""
+    world = Database(db_name=path)
+    generate_world(world, seed, locations=max(5, rows // 100), characters=rows, items=rows, enemies=rows, npcs=max(5, rows // 10))
+    return world
+
+# (label, tool, arguments) - the ids point into the middle of the world, which exists in all the sizes
+def benchmarks(rows) -> list[tuple]:
+    middle = rows // 2
+    return [
+        ("query_playable_characters[all]", server.query_playable_characters, {"action": "all"}),
+        ("query_playable_characters[by_id]", server.query_playable_characters, {"action": "by_id", "id": middle}),
+        ("query_locations[all]", server.query_locations, {"action": "all"}),
+        ("query_locations[by_id]", server.query_locations, {"action": "by_id", "id": 1}),
+        ("describe_location_snapshot", server.describe_location_snapshot, {"location_id": 1}),
+        ("get_alive_enemies_in_location", server.get_alive_enemies_in_location, {"location_id": 1}),
+        ("are_any_enemies_in_location", server.are_any_enemies_in_location, {"location_id": 1}),
+        ("get_enemy_info_by_id", server.get_enemy_info_by_id, {"enemy_id": middle}),
+        ("get_npcs_in_location", server.get_npcs_in_location, {"location_id": 1}),
+        ("get_npc_info_by_id", server.get_npc_info_by_id, {"npc_id": 0}),
+        ("get_item_by_id", server.get_item_by_id, {"item_id": middle}),
+        ("get_loot_items_from_enemy", server.get_loot_items_from_enemy, {"enemy_id": middle}),
+        ("get_quest_reward_item", server.get_quest_reward_item, {"npc_id": 0}),
+        ("get_characters_equipment", server.get_characters_equipment, {"character_id": middle}),
+        ("update_character_hitpoints", server.update_character_hitpoints, {"id": middle, "hitpoints": 90}),
+        ("update_enemy_hitpoints", server.update_enemy_hitpoints, {"enemy_id": middle, "new_hitpoints": 50}),
+        ("assign_item_to_character_equipment", server.assign_item_to_character_equipment, {"item_id": middle, "character_id": middle}),
+    ]
+
+async def measure(tool, arguments, repeat, max_time) -> dict:
+    await tool(**arguments) # Warm up
+    timings = []
+    deadline = time.perf_counter() + max_time
+    while len(timings) < repeat and (len(timings) < 3 or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        await tool(**arguments)
+        timings.append(time.perf_counter() - start)
+    return {
+        "calls": len(timings),
+        "median_us": statistics.median(timings) * 1e6,
+        "mean_us": statistics.mean(timings) * 1e6,
+        "min_us": min(timings) * 1e6,
+    }
+
+def run(args):
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.sizes:
+            start = time.perf_counter()
+            server.db = scaled_world(os.path.join(directory, f"world-{rows}.db"), rows, args.seed)
+            print(f"World of {rows} rows generated in {time.perf_counter() - start:.1f} s")
+
+            size_results = {}
+            for label, tool, arguments in benchmarks(rows):
+                size_results[label] = asyncio.run(measure(tool, arguments, args.repeat, args.max_time))
+                print(f"  {label:<40}{size_results[label]['median_us']:>14.1f} us")
+            results["sizes"][str(rows)] = size_results
+            server.db.close()
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+def compare(args):
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    regressions = 0
+    print(f"{'rows':>8} {'benchmark':<40}{'baseline us':>14}{'current us':>14}{'change':>10}")
+    for rows, current_results in current["sizes"].items():
+        for label, result in current_results.items():
+            base = baseline["sizes"].get(rows, {}).get(label)
+            if not base:
+                continue
+            change = result["median_us"] / base["median_us"] - 1
+            flag = ""
+            if change > args.threshold:
+                regressions += 1
+                flag = "  REGRESSION"
+            print(f"{rows:>8} {label:<40}{base['median_us']:>14.1f}{result['median_us']:>14.1f}{change:>+10.1%}{flag}")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) got slower by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print(f"No benchmark got slower by more than {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run the microbenchmarks and save the results as JSON')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 10000, 1000000], help='Rows per table of the measured worlds')
+    run_parser.add_argument('--repeat', type=int, default=200, help='Max number of measured calls per benchmark')
+    run_parser.add_argument('--max_time', type=float, default=2.0, help='Max seconds per benchmark (at least 3 calls are measured)')
+    run_parser.add_argument('--seed', type=int, default=0, help='Seed of the generated worlds')
+    run_parser.add_argument('--output', default='microbenchmarks.json', help='Path of the JSON results')
+    run_parser.set_defaults(run=run)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare the results with a baseline, exits with 1 on regressions')
+    compare_parser.add_argument('baseline', help='Path of the baseline JSON results')
+    compare_parser.add_argument('current', help='Path of the current JSON results')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='Allowed slowdown of the median, 0.1 means 10%%')
+    compare_parser.set_defaults(run=compare)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,95 @@
+import time
+import socket
+import itertools
+import contextlib
+from collections import OrderedDict
+
+import httpx
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+
+SESSION_HEADER = "mcp-session-id"
+# Headers of one hop (the router's connection), not passed on
+HOP_HEADERS = {"host", "connection", "keep-alive", "transfer-encoding", "content-length", "upgrade"}
+
+def free_port() -> int:
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        return listener.getsockname()[1]
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as connection:
+            if connection.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise TimeoutError(f"The server didn't start listening on port {port}")
+
+
+class SessionRouter:
+    """
+    The front of the --workers mode. Every MCP session lives in the memory of the worker process that created it, so
+    all the requests of a session are sent to that worker (by the mcp-session-id header), and the new sessions
+    (requests without the header) are spread over the workers round robin. The responses are streamed back as they
+    come, so the SSE streams of the MCP transport work through the router.
+    Only the last max_sessions sessions are remembered, an older one gets 404 and its client starts a new session,
+    like after a server restart.
+    """
+    def __init__(self, worker_urls, max_sessions=100000):
+        self.worker_urls = worker_urls
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict() # session_id -> index of its worker, least recently used first
+        self.next_worker = itertools.cycle(range(len(worker_urls)))
+        self.client = None # httpx.AsyncClient, open while the app runs
+
+    def worker_of(self, request: Request) -> int | None:
+        if request.url.path == "/metrics":
+            # Every worker has its own metrics, /metrics?worker=N
+            worker = int(request.query_params.get("worker", 0))
+            return worker if 0 <= worker < len(self.worker_urls) else None
+        session_id = request.headers.get(SESSION_HEADER)
+        if session_id is None:
+            return next(self.next_worker)
+        worker = self.sessions.get(session_id)
+        if worker is not None:
+            self.sessions.move_to_end(session_id)
+        return worker
+
+    async def forward(self, request: Request):
+        worker = self.worker_of(request)
+        if worker is None:
+            return PlainTextResponse("Session not found", status_code=404)
+
+        headers = [(name, value) for name, value in request.headers.items() if name not in HOP_HEADERS]
+        upstream = self.client.build_request(request.method, self.worker_urls[worker] + request.url.path,
+                                             params=request.query_params, headers=headers, content=await request.body())
+        response = await self.client.send(upstream, stream=True)
+
+        session_id = request.headers.get(SESSION_HEADER)
+        if session_id is None and SESSION_HEADER in response.headers:
+            self.sessions[response.headers[SESSION_HEADER]] = worker
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        elif session_id is not None and (request.method == "DELETE" or response.status_code == 404):
+            self.sessions.pop(session_id, None)
+
+        return StreamingResponse(response.aiter_raw(), status_code=response.status_code,
+                                 headers={name: value for name, value in response.headers.items() if name not in HOP_HEADERS},
+                                 background=BackgroundTask(response.aclose))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, app):
+        # No timeout - the SSE streams stay open as long as the session
+        async with httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=None, max_keepalive_connections=100)) as client:
+            self.client = client
+            yield
+            self.client = None
+
+    def app(self) -> Starlette:
+        methods = ["GET", "POST", "DELETE", "PUT", "PATCH", "OPTIONS", "HEAD"]
+        return Starlette(routes=[Route("/{path:path}", self.forward, methods=methods)], lifespan=self.lifespan)
@@ -0,0 +1,30 @@
+import os
+import sys
+import subprocess
+
+# TERMINAL
+# For instance: python.exe run_checks.py
+# Runs every check script of the server, each in its own process (they set up their own temporary database),
+# and exits with 1 when any of them failed. The repo has no test suite - this is the one command to run before a commit.
+
+CHECKS = [
+    "check_query_counts.py", # No tool call runs more SQL statements than its max_queries
+    "check_query_plans.py", # No tool statement does a full table scan (EXPLAIN QUERY PLAN)
+]
+
+def run_checks() -> list[str]:
+    """The names of the failed checks"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    failed = []
+    for check in CHECKS:
+        print(f"== {check}")
+        if subprocess.run([sys.executable, os.path.join(directory, check)], cwd=directory).returncode != 0:
+            failed.append(check)
+    return failed
+
+if __name__ == "__main__":
+    failed = run_checks()
+    if failed:
+        print(f"{len(failed)} of {len(CHECKS)} checks failed: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"All {len(CHECKS)} checks passed.")
@@ -1,12 +1,35 @@
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
 from mcp.server.fastmcp.prompts import base
+from mcp.types import ToolAnnotations
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
 
 import os
+import sys
+import signal
+import subprocess
+import contextlib
+import functools
+import hashlib
+import json
+import random
+import logging
+import time
+import weakref
 import dotenv
 import argparse
 import uvicorn
 
-from database import Database
+from database import Database, LOCATION_SNAPSHOT_QUERY, LOCATION_SNAPSHOT_LOCATION, LOCATION_SNAPSHOT_NPC, LOCATION_SNAPSHOT_ENEMY
+from worlds import WorldManager, WorldExpiredError
+from router import SessionRouter, free_port, wait_for_port
+from worldgen import generate_world, world_counts
+from world_io import import_world
+import combat
+import batch_operations
+from structured_logging import setup_logging, Sampler
+from metrics import REGISTRY, TOOL_CALLS, TOOL_ERRORS, TOOL_DURATION, TOOLS_IN_FLIGHT, ROW_CACHE_ROWS
+from formatting import OUTPUT_FORMATS, CATALOG_ITEM_COLUMNS, COMBAT_OUTCOME_COLUMNS, CHARACTER_COLUMNS, LOCATION_COLUMNS, ENEMY_COLUMNS, NPC_COLUMNS, ITEM_COLUMNS, LOCAL_ENEMY_COLUMNS, LOCAL_NPC_COLUMNS, PAGE_COLUMNS, render_rows, render_sections
 
 # TERMINAL
 # For instance: python.exe server.py --host 127.0.0.1 --port 8080
@@ -36,12 +59,71 @@ with open(validated_path, "r") as file:
     initial_prompt = file.read()
     initial_prompt = "\n".join(line for line in initial_prompt.splitlines() if line.strip())
 
-db = Database(db_name=os.path.join(os.path.dirname(os.path.abspath(__file__)), "rpg_database.db"))
+DEFAULT_DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rpg_database.db")
+db = None # Database of the game, opened by configure (--db_file); the benchmarks and checks set their own
+worlds = None # WorldManager, when every MCP session gets its own world (--per_session_worlds)
 
-g_verbose = False
-def log(*args):
-    if g_verbose:
-        print(f"{args}")
+logger = logging.getLogger("rpg_server") # Set up in configure, see structured_logging.py
+logger.setLevel(logging.WARNING) # Quiet when imported by the benchmarks and checks, like the old log()
+tool_call_sampler = Sampler() # Rate of the logged tool_call events (--log_sample_rate)
+
+def log(message, *args, level=logging.INFO, **fields):
+    """
+    Logs a JSON line with the message and the structured fields, without blocking (the writing is done on a background thread).
+    The message is %-formatted with the args lazily - only when the level is enabled - so pass the values as args, not in an f-string.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args, extra={"fields": fields})
+
+combat_rng = random.Random() # Seeded with --combat_seed for reproducible fights
+
+g_output_format = "prose"
+def get_output_format(output_format=""):
+    """The format requested for the call, or the server's default (--output_format)"""
+    return output_format if output_format in OUTPUT_FORMATS else g_output_format
+
+def session_id_of(ctx: Context = None) -> str | None:
+    if worlds is None or ctx is None:
+        return None
+    request = ctx.request_context.request
+    return request.headers.get("mcp-session-id") if request else None
+
+async def get_db(ctx: Context = None) -> Database:
+    """Returns the world of the session that called the tool, or the shared world"""
+    session_id = session_id_of(ctx)
+    if not session_id:
+        return db
+    return await worlds.get(session_id)
+
+@contextlib.asynccontextmanager
+async def session_world(ctx: Context = None):
+    """Keeps the world of the session that called the tool open (not evicted) for the whole call"""
+    session_id = session_id_of(ctx)
+    if not session_id:
+        yield db
+        return
+    async with worlds.use(session_id) as world:
+        yield world
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+async def read_page(db: Database, table, cursor=-1, limit=DEFAULT_PAGE_SIZE) -> tuple[list, int, int | None]:
+    """
+    A page of the table's rows by keyset pagination on id - the rows after the cursor (the last id of the previous page).
+    Returns (rows, total number of rows in the table, the cursor of the next page or None on the last page).
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    total = (await db.read_one(f"SELECT COUNT(*) FROM {table}"))[0]
+    # One row more than the page tells if there is a next page
+    rows = await db.read_all(f"SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (cursor, limit + 1))
+    if len(rows) > limit:
+        return rows[:limit], total, rows[limit - 1]["id"]
+    return rows, total, None
+
+def page_footer(label, shown, total, next_cursor) -> str:
+    if next_cursor is None:
+        return f"{shown} of {total} {label} shown, this is the last page.\n"
+    return f"{shown} of {total} {label} shown, for the next page call again with cursor={next_cursor}.\n"
 
 mcp_app = FastMCP(
     name="RPG MCP", 
@@ -49,38 +131,89 @@ mcp_app = FastMCP(
     instructions="Your responses should be shorter than 300 characters" #customize the model’s behavior globally
 )
 
-@mcp_app.tool()
-async def query_playable_characters(action: str = "all", id: int = -1) -> str:
+def game_tool(max_queries, read_only=False):
+    """
+    Registers an MCP tool, documenting the max number of SQL statements one call of it may run.
+    The read only tools (that don't change the world) are annotated so (readOnlyHint), the clients can run them concurrently.
+    Calls over the limit are logged, tests can check it with Database.count_queries() and the tool's max_queries.
+    Every call is recorded in the /metrics endpoint's tool metrics (calls, errors, duration, in flight).
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        async def tool(*args, **kwargs):
+            name = function.__name__
+            TOOL_CALLS.inc(name)
+            TOOLS_IN_FLIGHT.inc(name)
+            start = time.perf_counter()
+            try:
+                with Database.count_queries() as counter:
+                    async with session_world(kwargs.get("ctx")):
+                        result = await function(*args, **kwargs)
+            except WorldExpiredError as e:
+                log("%s was called by a session whose world expired", name, level=logging.WARNING, event="world_expired", tool=name)
+                result = f"World expired: {e} - it wasn't played for longer than the server keeps the idle worlds. Start a new game (reconnect) to play in a new world."
+            except Exception:
+                TOOL_ERRORS.inc(name)
+                raise
+            finally:
+                TOOL_DURATION.observe(time.perf_counter() - start, name)
+                TOOLS_IN_FLIGHT.dec(name)
+            # The tools report the DB failures in their response instead of raising
+            if isinstance(result, str) and result.startswith(("DB Error:", "World expired:")):
+                TOOL_ERRORS.inc(name)
+            if counter.count > max_queries:
+                log("%s ran %s queries, its limit is %s", name, counter.count, max_queries, level=logging.WARNING,
+                    event="query_limit_exceeded", tool=name, queries=counter.count, max_queries=max_queries)
+            if logger.isEnabledFor(logging.DEBUG) and tool_call_sampler():
+                log("%s was served", name, level=logging.DEBUG, event="tool_call", tool=name,
+                    duration_ms=round((time.perf_counter() - start) * 1000, 3), queries=counter.count)
+            return result
+
+        tool.max_queries = max_queries
+        tool.read_only = read_only
+        mcp_app.tool(annotations=ToolAnnotations(readOnlyHint=read_only))(tool)
+        return tool
+    return decorator
+
+@game_tool(max_queries=2, read_only=True)
+async def query_playable_characters(action: str = "all", id: int = -1, limit: int = DEFAULT_PAGE_SIZE, cursor: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
-    Read info on all existing playable characters from the DB or read info on a specific character by ID.
+    Read info on all existing playable characters from the DB (a page at a time) or read info on a specific character by ID.
     action: 'all' or 'by_id'
     id: used only for 'by_id' action
+    limit: max number of characters of the page, used only for 'all' action (1 - 200)
+    cursor: used only for 'all' action, leave -1 for the first page, then pass the cursor given with the previous page
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
         if action == "all":
-            log(f"query_characters (all) was called")
-            c = db.execute_read("SELECT * FROM characters")
-            rows = c.fetchall()
-            # return "\n".join(str(row) for row in rows)
-            characters = ""
-            for row in rows:
-                characters += f"Character's name: {row['name']}, character's id: {row['id']}, character's class: {row['class']}, character's race: {row['race']}, character's HP: {row['hitpoints']}\n"
-            return characters
+            log("query_characters (all) was called", cursor=cursor, limit=limit)
+            rows, total, next_cursor = await read_page(db, "characters", cursor, limit)
+            if output_format != "prose":
+                return render_sections([("characters", rows, CHARACTER_COLUMNS),
+                                        ("page", [{"total": total, "next_cursor": next_cursor}], PAGE_COLUMNS)], output_format)
+            characters = [f"Character's name: {row['name']}, character's id: {row['id']}, character's class: {row['class']}, character's race: {row['race']}, character's HP: {row['hitpoints']}\n"
+                          for row in rows]
+            characters.append(page_footer("characters", len(rows), total, next_cursor))
+            return "".join(characters)
         elif action == "by_id" and id >= 0:
-            log(f"query_characters (by_id) was called")
-            c = db.execute_read("SELECT * FROM characters WHERE id = ?", (id,))
-            row = c.fetchone()
+            log("query_characters (by_id) was called")
+            row = await db.read_one("SELECT * FROM characters WHERE id = ?", (id,))
+            if row and output_format != "prose":
+                return render_rows("character", [row], CHARACTER_COLUMNS, output_format)
             # return str(row) if row else "No character found."
             return f"Character's name: {row['name']}, character's id (secret): {row['id']}, character's class: {row['class']}, character's race: {row['race']}, character's HP: {row['hitpoints']}\n" if row else "No character found."
         else:
-            log(f"query_characters was called but it failed!")
+            log("query_characters was called but it failed!")
             return "Invalid action or missing parameters."
     except Exception as e:
-        log(f"query_characters was called, but an exception occurred")
+        log("query_characters was called, but an exception occurred", level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
     
-@mcp_app.tool()
-async def create_and_add_new_character(name: str = "", class_name: str = "", race: str = "", hitpoints: int = -1) -> str:
+@game_tool(max_queries=1)
+async def create_and_add_new_character(name: str = "", class_name: str = "", race: str = "", hitpoints: int = -1, ctx: Context = None) -> str:
     """
     Create a new playable character, and save it in the DB.
     name: name of the character
@@ -89,17 +222,17 @@ async def create_and_add_new_character(name: str = "", class_name: str = "", rac
     hitpoints: initial hitpoints of the character
     """
     try:
-        log(f"create_and_add_new_character was called with the following args: name: {name}, class_name: {class_name}, race: {race}, hitpoints: {hitpoints}")
-        db.execute_write("INSERT INTO characters (name, class, race, hitpoints) VALUES (?, ?, ?, ?)",
+        db = await get_db(ctx)
+        log("create_and_add_new_character was called with the following args: name: %s, class_name: %s, race: %s, hitpoints: %s", name, class_name, race, hitpoints)
+        new_id = await db.write("INSERT INTO characters (name, class, race, hitpoints) VALUES (?, ?, ?, ?)",
                             (name, class_name, race, hitpoints))
-        new_id = db.connection.execute("SELECT id FROM characters WHERE name = ? AND class = ? AND race = ? AND hitpoints = ?", (name, class_name, race, hitpoints)).fetchone()[0]
         return f"Character named {name} created successfully. Character ID is: {new_id}"
     except Exception as e:
-        log(f"create_and_add_new_character was called but an exception occurred")
+        log("create_and_add_new_character was called but an exception occurred", level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def update_character_hitpoints(id: int = -1, hitpoints: int = -1) -> str:
+@game_tool(max_queries=1)
+async def update_character_hitpoints(id: int = -1, hitpoints: int = -1, ctx: Context = None) -> str:
     """
     Update the current hitpoints of a character, save that info in the DB.
     This is useful to save the character's hitpoints each time it takes damage or heals.
@@ -107,110 +240,130 @@ async def update_character_hitpoints(id: int = -1, hitpoints: int = -1) -> str:
     hitpoints: new hitpoints value for the character that overrides the previous one
     """
     try:
-        log(f"update_character was called with the following args: id: {id}, hitpoints: {hitpoints}")
-        db.execute_write("UPDATE characters SET hitpoints = ? WHERE id = ?",
+        db = await get_db(ctx)
+        log("update_character was called with the following args: id: %s, hitpoints: %s", id, hitpoints)
+        await db.write("UPDATE characters SET hitpoints = ? WHERE id = ?",
                             (hitpoints, id))
         return f"Character updated successfully. Character {id} now has {hitpoints} hitpoints."
     except Exception as e:
-        log(f"update_character was called but an exception occurred")
+        log("update_character was called but an exception occurred", level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def query_locations(action: str = "all", id: int = -1) -> str:
+@game_tool(max_queries=2, read_only=True)
+async def query_locations(action: str = "all", id: int = -1, limit: int = DEFAULT_PAGE_SIZE, cursor: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
-    Read info on all existing locations from the DB or read info on a specific location by ID.
+    Read info on all existing locations from the DB (a page at a time) or read info on a specific location by ID.
     action: 'all' or 'by_id'
     id: used only for 'by_id' action
+    limit: max number of locations of the page, used only for 'all' action (1 - 200)
+    cursor: used only for 'all' action, leave -1 for the first page, then pass the cursor given with the previous page
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
         if action == "all":
-            log(f"query_locations (all) was called")
-            c = db.execute_read("SELECT * FROM location")
-            rows = c.fetchall()
-            locations = ""
-            for row in rows:
-                locations += f"Location's name: {row['name']}, location's id (secret): {row['id']}, location's description: {row['description']}\n"
-            return locations
+            log("query_locations (all) was called", cursor=cursor, limit=limit)
+            rows, total, next_cursor = await read_page(db, "location", cursor, limit)
+            if output_format != "prose":
+                return render_sections([("locations", rows, LOCATION_COLUMNS),
+                                        ("page", [{"total": total, "next_cursor": next_cursor}], PAGE_COLUMNS)], output_format)
+            locations = [f"Location's name: {row['name']}, location's id (secret): {row['id']}, location's description: {row['description']}\n"
+                         for row in rows]
+            locations.append(page_footer("locations", len(rows), total, next_cursor))
+            return "".join(locations)
         elif action == "by_id" and id >= 0:
-            log(f"query_locations (by_id): {id} was called")
-            c = db.execute_read("SELECT * FROM location WHERE id = ?", (id,))
-            row = c.fetchone()
+            log("query_locations (by_id): %s was called", id)
+            row = await db.read_row("location", id)
+            if row and output_format != "prose":
+                return render_rows("location", [row], LOCATION_COLUMNS, output_format)
             return f"Location's name: {row['name']}, location's id (secret): {row['id']}, location's description: {row['description']}\n" if row else "No location found."
         else:
-            log(f"query_locations was called but it failed!")
+            log("query_locations was called but it failed!")
             return "Invalid action or missing parameters."
     except Exception as e:
-        log(f"query_locations was called, but an exception occurred")
+        log("query_locations was called, but an exception occurred", level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
     
-@mcp_app.tool()
-async def get_alive_enemies_in_location(location_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def get_alive_enemies_in_location(location_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
     Get all alive enemies, that can be fought, in a specific location.
     location_id: ID of the location to query
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
-        log(f"get_alive_enemies_in_location was called with location_id: {location_id}")
-        c = db.execute_read("SELECT * FROM enemies WHERE spawn_location = ?", (location_id,))
-        rows = c.fetchall()
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("get_alive_enemies_in_location was called with location_id: %s", location_id)
+        rows = await db.read_all("SELECT * FROM enemies WHERE spawn_location = ?", (location_id,))
         if not rows:
             return "No enemies found in this location."
+        if output_format != "prose":
+            return render_rows("enemies", rows, ENEMY_COLUMNS, output_format)
         enemies = ""
         for row in rows:
             enemies += f"Enemy's name: {row['name']}, enemy's id: {row['id']}, enemy's description: {row['description']}, enemy's hitpoints: {row['hitpoints']}, enemy's base_damage: {row['base_damage']}\n"
         return enemies
     except Exception as e:
-        log(f"get_alive_enemies_in_location was called, but an exception {e} occurred")
+        log("get_alive_enemies_in_location was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
     
-@mcp_app.tool()
-async def are_any_enemies_in_location(location_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def are_any_enemies_in_location(location_id: int = -1, ctx: Context = None) -> str:
     """
     Check if there are any enemies in a specific location. Get True/False response.
     This is useful to quickly check if the location is safe or if there are enemies to fight
     location_id: ID of the location to query
     """
     try:
-        log(f"are_any_enemies_in_location was called with location_id: {location_id}")
-        c = db.execute_read("SELECT COUNT(*) FROM enemies WHERE spawn_location = ? AND hitpoints > 0", (location_id,))
-        count = c.fetchone()[0]
+        db = await get_db(ctx)
+        log("are_any_enemies_in_location was called with location_id: %s", location_id)
+        row = await db.read_one("SELECT COUNT(*) FROM enemies WHERE spawn_location = ? AND hitpoints > 0", (location_id,))
+        count = row[0]
         return "Yes, there are enemies in this location." if count > 0 else "No enemies found in this location."
     except Exception as e:
-        log(f"are_any_enemies_in_location was called, but an exception {e} occurred")
+        log("are_any_enemies_in_location was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def get_enemy_info_by_id(enemy_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def get_enemy_info_by_id(enemy_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
     Get information about a specific enemy by ID.
     This includes the enemy's name, description, hitpoints, base damage, and spawn location.
     enemy_id: ID of the enemy to query
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
-        log(f"get_enemy_info_by_id was called with enemy_id: {enemy_id}")
-        c = db.execute_read("SELECT * FROM enemies WHERE id = ?", (enemy_id,))
-        row = c.fetchone()
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("get_enemy_info_by_id was called with enemy_id: %s", enemy_id)
+        row = await db.read_row("enemies", enemy_id)
+        if row and output_format != "prose":
+            return render_rows("enemy", [row], ENEMY_COLUMNS, output_format)
         return f"Enemy's name: {row['name']}, enemy's id (secret): {row['id']}, enemy's description: {row['description']}, enemy's hitpoints: {row['hitpoints']}, enemy's base_damage: {row['base_damage']}, enemy's spawn_location: {row['spawn_location']}\n" if row else "No enemy found."
     except Exception as e:
-        log(f"get_enemy_info_by_id was called, but an exception {e} occurred")
+        log("get_enemy_info_by_id was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def delete_dead_enemies_from_db() -> str:
+@game_tool(max_queries=1)
+async def delete_dead_enemies_from_db(ctx: Context = None) -> str:
     """
     Delete all dead enemies (hitpoints <= 0) from the DB. 
     This is useful to keep the DB clean and remove enemies that are no longer relevant.
     """
     try:
-        log(f"delete_dead_enemies_from_db was called")
-        db.execute_write("DELETE FROM enemies WHERE hitpoints <= 0")
+        db = await get_db(ctx)
+        log("delete_dead_enemies_from_db was called")
+        await db.write("DELETE FROM enemies WHERE hitpoints <= 0")
+        db.cache.invalidate("enemies")
         return "Dead enemies deleted successfully."
     except Exception as e:
-        log(f"delete_dead_enemies_from_db was called, but an exception {e} occurred")
+        log("delete_dead_enemies_from_db was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def update_enemy_hitpoints(enemy_id: int = -1, new_hitpoints: int = -1) -> str:
+@game_tool(max_queries=1)
+async def update_enemy_hitpoints(enemy_id: int = -1, new_hitpoints: int = -1, ctx: Context = None) -> str:
     """
     Update the hitpoints of an enemy in the DB.
     This is useful to save the enemy's hitpoints each time it takes damage.
@@ -218,67 +371,183 @@ async def update_enemy_hitpoints(enemy_id: int = -1, new_hitpoints: int = -1) ->
     new_hitpoints: new hitpoints value for the enemy that overrides the previous one
     """
     try:
-        log(f"update_enemy_hitpoints was called with args: enemy_id: {enemy_id}, new_hitpoints: {new_hitpoints}")
-        db.execute_write("UPDATE enemies SET hitpoints = ? WHERE id = ?", (new_hitpoints, enemy_id))
+        db = await get_db(ctx)
+        log("update_enemy_hitpoints was called with args: enemy_id: %s, new_hitpoints: %s", enemy_id, new_hitpoints)
+        await db.write("UPDATE enemies SET hitpoints = ? WHERE id = ?", (new_hitpoints, enemy_id))
+        db.cache.invalidate("enemies", enemy_id)
         return "Enemy hitpoints updated successfully."
     except Exception as e:
-        log(f"update_enemy_hitpoints was called, but an exception {e} occurred")
+        log("update_enemy_hitpoints was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
+        return f"DB Error: {e}"
+
+@game_tool(max_queries=6)
+async def resolve_attack(character_id: int = -1, enemy_id: int = -1, item_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
+    """
+    Resolve one round of combat: the character attacks the enemy, then the enemy, if it survived, attacks back.
+    Damage is rolled from the weapon's hitpoint impact and the enemy's base damage, reduced by the character's own armor and shield. Both hitpoints are saved and a defeated enemy is removed from the DB at once.
+    Returns the outcome and the defeated enemy's loot. Use it for every attack instead of updating the hitpoints yourself.
+    character_id: ID of the attacking character
+    enemy_id: ID of the attacked enemy
+    item_id: ID of the weapon the character attacks with, -1 when unarmed
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
+    """
+    try:
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("resolve_attack was called with args: character_id: %s, enemy_id: %s, item_id: %s", character_id, enemy_id, item_id)
+        result = await db.transaction(lambda connection: combat.resolve_attack(connection, combat_rng, character_id, enemy_id, item_id))
+        db.cache.invalidate("enemies", enemy_id)
+
+        outcome, loot = result["outcome"], result["loot"]
+        if output_format != "prose":
+            return render_sections([("outcome", [outcome], COMBAT_OUTCOME_COLUMNS), ("loot", loot, ITEM_COLUMNS)], output_format)
+
+        response = f"{outcome['character_name']} hit {outcome['enemy_name']} with {outcome['weapon']} for {outcome['damage_dealt']} damage.\n"
+        if outcome['enemy_defeated']:
+            response += f"{outcome['enemy_name']} was defeated and removed from the DB.\n"
+            if not loot:
+                return response + "The enemy dropped no loot.\n"
+            response += "Loot dropped by the enemy (not owned by anyone yet):\n"
+            for item in loot:
+                response += f"Item's name: {item['name']}, Item's id (secret): {item['id']}, Item's type: {item['type']}, Item's description: {item['functional_descr']}, Item's hitpoint impact: {item['hitpoint_impact']}, Item's rarity: {item['rarity']}\n"
+            return response
+
+        response += f"{outcome['enemy_name']} has {outcome['enemy_hitpoints']} hitpoints left and hit back for {outcome['damage_taken']} damage. "
+        response += f"{outcome['character_name']} has {outcome['character_hitpoints']} hitpoints left.\n"
+        if outcome['character_dead']:
+            response += f"{outcome['character_name']} has died.\n"
+        return response
+    except combat.CombatError as e:
+        log("resolve_attack was called, but the attack is not possible: %s", e)
+        return str(e)
+    except Exception as e:
+        log("resolve_attack was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def get_npcs_in_location(location_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def get_npcs_in_location(location_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
     Get all present NPCs in a specific location.
     location_id: ID of the location to query
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
-        log(f"get_npcs_in_location was called with location_id: {location_id}")
-        c = db.execute_read("SELECT * FROM npc WHERE spawn_location = ?", (location_id,))
-        rows = c.fetchall()
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("get_npcs_in_location was called with location_id: %s", location_id)
+        rows = await db.read_all("SELECT * FROM npc WHERE spawn_location = ?", (location_id,))
         if not rows:
             return "No NPCs found in this location."
+        if output_format != "prose":
+            return render_rows("npcs", rows, NPC_COLUMNS, output_format)
         npcs = ""
         for row in rows:
             npcs += f"NPC's name: {row['name']}, NPC's id (secret): {row['id']}, NPC's description: {row['description']}, NPC's information to give: {row['information_to_give']}, NPC's quest to give: {row['quest_to_give']}, NPC's reward Item id: {row['reward_id']}\n"
         return npcs
     except Exception as e:
-        log(f"get_npcs_in_location was called, but an exception {e} occurred")
+        log("get_npcs_in_location was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
+        return f"DB Error: {e}"
+
+@game_tool(max_queries=1, read_only=True)
+async def describe_location_snapshot(location_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
+    """
+    Get everything about a location in one call: the location's info, all NPCs present in it, and all alive enemies with the loot they drop.
+    Use it every time the player enters or looks around a location, instead of calling the separate location, NPC, enemy and loot tools.
+    location_id: ID of the location to describe
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
+    """
+    try:
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("describe_location_snapshot was called with location_id: %s", location_id)
+        rows = await db.read_all(LOCATION_SNAPSHOT_QUERY, {"location_id": location_id})
+        if not rows or rows[0]['kind'] != LOCATION_SNAPSHOT_LOCATION:
+            return "No location found."
+
+        location = rows[0]
+        npcs = [row for row in rows if row['kind'] == LOCATION_SNAPSHOT_NPC]
+        enemies = [row for row in rows if row['kind'] == LOCATION_SNAPSHOT_ENEMY]
+
+        if output_format != "prose":
+            # The enemy rows repeat for every loot item, so the enemies and their loot are split into separate sections
+            enemy_rows = list({row['id']: row for row in enemies}.values())
+            loot_rows = [{"enemy_id": row['id'], "id": row['item_id'], "name": row['item_name'], "type": row['item_type'],
+                          "functional_descr": row['item_descr'], "hitpoint_impact": row['item_hitpoint_impact'],
+                          "rarity": row['item_rarity'], "owner_id": row['item_owner_id']}
+                         for row in enemies if row['item_id'] is not None]
+            return render_sections([
+                ("location", [location], LOCATION_COLUMNS),
+                ("npcs", npcs, LOCAL_NPC_COLUMNS),
+                ("enemies", enemy_rows, LOCAL_ENEMY_COLUMNS),
+                ("loot", loot_rows, ("enemy_id",) + ITEM_COLUMNS),
+            ], output_format)
+
+        snapshot = f"Location's name: {location['name']}, location's id (secret): {location['id']}, location's description: {location['description']}\n"
+        if npcs:
+            snapshot += "NPCs in this location:\n"
+            for row in npcs:
+                snapshot += f"NPC's name: {row['name']}, NPC's id (secret): {row['id']}, NPC's description: {row['description']}, NPC's information to give: {row['information_to_give']}, NPC's quest to give: {row['quest_to_give']}, NPC's reward Item id: {row['reward_id']}\n"
+        else:
+            snapshot += "No NPCs found in this location.\n"
+
+        if not enemies:
+            return snapshot + "No enemies found in this location.\n"
+        snapshot += "Alive enemies in this location:\n"
+        previous_enemy_id = None
+        for row in enemies:
+            # One row per loot item, the enemy is described only once
+            if row['id'] != previous_enemy_id:
+                snapshot += f"Enemy's name: {row['name']}, enemy's id: {row['id']}, enemy's description: {row['description']}, enemy's hitpoints: {row['hitpoints']}, enemy's base_damage: {row['base_damage']}\n"
+                previous_enemy_id = row['id']
+            if row['item_id'] is not None:
+                snapshot += f"    Loot - Item's name: {row['item_name']}, Item's id (secret): {row['item_id']}, Item's type: {row['item_type']}, Item's description: {row['item_descr']}, Item's hitpoint impact: {row['item_hitpoint_impact']}, Item's rarity: {row['item_rarity']}, Item's owner ID: {row['item_owner_id']}\n"
+        return snapshot
+    except Exception as e:
+        log("describe_location_snapshot was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def get_npc_info_by_id(npc_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def get_npc_info_by_id(npc_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
     Get information about a specific NPC by ID.
     This includes the NPC's name, description, information to give, quest to give, spawn location, and reward item ID.
     npc_id: ID of the NPC to query
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
-        log(f"get_npc_info_by_id was called with npc_id: {npc_id}")
-        c = db.execute_read("SELECT * FROM npc WHERE id = ?", (npc_id,))
-        row = c.fetchone()
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("get_npc_info_by_id was called with npc_id: %s", npc_id)
+        row = await db.read_row("npc", npc_id)
+        if row and output_format != "prose":
+            return render_rows("npc", [row], NPC_COLUMNS, output_format)
         return f"NPC's name: {row['name']}, NPC's id (secret): {row['id']}, NPC's description: {row['description']}, NPC's information to give: {row['information_to_give']}, NPC's quest to give: {row['quest_to_give']}, NPC's reward Item ID: {row['reward_id']}, NPC's spawn location ID: {row['spawn_location']}\n" if row else "No NPC found."
     except Exception as e:
-        log(f"get_npc_info_by_id was called, but an exception {e} occurred")
+        log("get_npc_info_by_id was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def get_item_by_id(item_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def get_item_by_id(item_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
     Get information about a specific item by ID.
     This includes the item's name, type, description, hitpoint impact (how much it heals or damages), rarity, and owner ID.
     item_id: ID of the item to query
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
-        log(f"get_item_by_id was called with item_id: {item_id}")
-        c = db.execute_read("SELECT * FROM items WHERE id = ?", (item_id,))
-        row = c.fetchone()
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("get_item_by_id was called with item_id: %s", item_id)
+        row = await db.read_row("items", item_id)
+        if row and output_format != "prose":
+            return render_rows("item", [row], ITEM_COLUMNS, output_format)
         return f"Item's name: {row['name']}, Item's id: {row['id']}, Item's type: {row['type']}, Item's description: {row['functional_descr']}, Item's hitpoint impact: {row['hitpoint_impact']}, Item's rarity: {row['rarity']}, Item's owner ID: {row['owner_id']}\n" if row else "No item found."
     except Exception as e:
-        log(f"get_item_by_id was called, but an exception {e} occurred")
+        log("get_item_by_id was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def assign_item_to_character_equipment(item_id: int = -1, character_id: int = -1) -> str:
+@game_tool(max_queries=1)
+async def assign_item_to_character_equipment(item_id: int = -1, character_id: int = -1, ctx: Context = None) -> str:
     """
     Assign an existing item to a character's equipment. Character must exist in the DB and will become an owner of the item.
     Only items assigned to a character in DB can be treated as part of the character's equipment.
@@ -286,85 +555,97 @@ async def assign_item_to_character_equipment(item_id: int = -1, character_id: in
     character_id: ID of the character to assign the item to
     """
     try:
-        log(f"assign_item_to_character_equipment was called with item_id: {item_id} and character_id: {character_id}")
-        c = db.execute_read("UPDATE items SET owner_id = ? WHERE id = ?", (character_id, item_id))
-        db.connection.commit()
+        db = await get_db(ctx)
+        log("assign_item_to_character_equipment was called with item_id: %s and character_id: %s", item_id, character_id)
+        changed = await db.transaction(lambda connection: connection.execute("UPDATE items SET owner_id = ? WHERE id = ?", (character_id, item_id)).rowcount)
+        if not changed:
+            return f"No item found with ID {item_id}."
+        db.cache.invalidate("items", item_id)
         return f"Item with ID {item_id} has been assigned to character with ID {character_id}."
     except Exception as e:
-        log(f"assign_item_to_character_equipment was called, but an exception {e} occurred")
+        log("assign_item_to_character_equipment was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def get_loot_items_from_enemy(enemy_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def get_loot_items_from_enemy(enemy_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
     Get loot items that can be obtained from defeating a specific enemy.
     This includes the item's ID, name, type, description, hitpoint impact, rarity, and owner ID.
     Enemy's loot is initially not owned by any character, but can be assigned to a character's equipment.
     This is useful to immediately inform the player about the loot they can obtain after defeating an enemy.
     enemy_id: ID of the enemy to query
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
-        log(f"get_loot_items_from_enemy was called with enemy_id: {enemy_id}")
-        c = db.execute_read("SELECT item_id FROM loot WHERE enemy_id = ?", (enemy_id,))
-        loot_items = c.fetchall()
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("get_loot_items_from_enemy was called with enemy_id: %s", enemy_id)
+        loot_items = await db.read_all("SELECT items.* FROM loot JOIN items ON items.id = loot.item_id WHERE loot.enemy_id = ?", (enemy_id,))
         if not loot_items:
             return f"No loot items found for enemy with ID {enemy_id}."
+        if output_format != "prose":
+            return render_rows("loot", loot_items, ITEM_COLUMNS, output_format)
         loot_items_str = ""
-        for row in loot_items:
-            c = db.execute_read("SELECT * FROM items WHERE id = ?", (row['item_id'],))
-            item = c.fetchone()
-            if item:
-                loot_items_str += f"Item's name: {item['name']},  Item's id (secret): {item['id']}, Item's type: {item['type']}, Item's description: {item['functional_descr']}, Item's hitpoint impact: {item['hitpoint_impact']}, Item's rarity: {item['rarity']}, Item's owner ID: {item['owner_id']}\n"
+        for item in loot_items:
+            loot_items_str += f"Item's name: {item['name']},  Item's id (secret): {item['id']}, Item's type: {item['type']}, Item's description: {item['functional_descr']}, Item's hitpoint impact: {item['hitpoint_impact']}, Item's rarity: {item['rarity']}, Item's owner ID: {item['owner_id']}\n"
         return loot_items_str
     except Exception as e:
-        log(f"get_loot_items_from_enemy was called, but an exception {e} occurred")
+        log("get_loot_items_from_enemy was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def get_quest_reward_item(npc_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def get_quest_reward_item(npc_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
     Get the quest reward item details for a specific NPC.
     This is useful to inform the player about the reward they can receive or are receiving for completing a quest given by the NPC.
     npc_id: ID of the NPC that gives the reward for quest completion
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
-        log(f"get_quest_reward_item was called with npc_id: {npc_id}")
-        c = db.execute_read("SELECT reward_id FROM npc WHERE id = ?", (npc_id,))
-        reward_item = c.fetchone()
-        if not reward_item:
-            return f"No quest reward item found for NPC with ID {npc_id}."
-        c = db.execute_read("SELECT * FROM items WHERE id = ?", (reward_item['reward_id'],))
-        reward_item = c.fetchone()
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("get_quest_reward_item was called with npc_id: %s", npc_id)
+        npc = await db.cached_row("npc", npc_id)
+        if npc:
+            reward_item = await db.read_row("items", npc['reward_id']) if npc['reward_id'] is not None else None
+        else:
+            reward_item = await db.read_one("SELECT items.* FROM npc JOIN items ON items.id = npc.reward_id WHERE npc.id = ?", (npc_id,))
         if not reward_item:
             return f"No quest reward item found for NPC with ID {npc_id}."
+        if output_format != "prose":
+            return render_rows("reward", [reward_item], ITEM_COLUMNS, output_format)
         return f"Item's name: {reward_item['name']}, Item's id (secret): {reward_item['id']}, Item's type: {reward_item['type']}, Item's description: {reward_item['functional_descr']}, Item's hitpoint impact: {reward_item['hitpoint_impact']}, Item's rarity: {reward_item['rarity']}, Item's owner ID: {reward_item['owner_id']}\n"
     except Exception as e:
-        log(f"get_quest_reward_item was called, but an exception {e} occurred")
+        log("get_quest_reward_item was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def get_characters_equipment(character_id: int = -1) -> str:
+@game_tool(max_queries=1, read_only=True)
+async def get_characters_equipment(character_id: int = -1, output_format: str = "", ctx: Context = None) -> str:
     """
     Get the equipment of a specific character.
     This includes all items owned by the character.
     character_id: ID of the character to query
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
     """
     try:
-        log(f"get_characters_equipment was called with character_id: {character_id}")
-        c = db.execute_read("SELECT * FROM items WHERE owner_id = ?", (character_id,))
-        rows = c.fetchall()
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("get_characters_equipment was called with character_id: %s", character_id)
+        rows = await db.read_all("SELECT * FROM items WHERE owner_id = ?", (character_id,))
         if not rows:
             return f"No equipment found for character with ID {character_id}."
+        if output_format != "prose":
+            return render_rows("equipment", rows, ITEM_COLUMNS, output_format)
         equipment = ""
         for row in rows:
             equipment += f"Item's name: {row['name']}, Item's id (secret): {row['id']}, Item's type: {row['type']}, Item's description: {row['functional_descr']}, Item's hitpoint impact: {row['hitpoint_impact']}, Item's rarity: {row['rarity']}\n"
         return equipment
     except Exception as e:
-        log(f"get_characters_equipment was called, but an exception {e} occurred")
+        log("get_characters_equipment was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
-@mcp_app.tool()
-async def remove_item_from_characters_equipment(item_id: int = -1, character_id: int = -1) -> str:
+@game_tool(max_queries=1)
+async def remove_item_from_characters_equipment(item_id: int = -1, character_id: int = -1, ctx: Context = None) -> str:
     """
     Remove an item from a character's equipment after it has been used or dropped.
     This is useful when done immediately after item is used, dropped or given keep the character's equipment up-to-date.
@@ -372,33 +653,277 @@ async def remove_item_from_characters_equipment(item_id: int = -1, character_id:
     character_id: ID of the character to remove the item from
     """
     try:
-        log(f"remove_item_from_characters_equipment was called with item_id: {item_id}, character_id: {character_id}")
-        db.execute_write("DELETE FROM items WHERE id = ? AND owner_id = ?", (item_id, character_id))
+        db = await get_db(ctx)
+        log("remove_item_from_characters_equipment was called with item_id: %s, character_id: %s", item_id, character_id)
+        removed = await db.transaction(lambda connection: connection.execute("DELETE FROM items WHERE id = ? AND owner_id = ?", (item_id, character_id)).rowcount)
+        if not removed:
+            return f"Character with ID {character_id} doesn't own an item with ID {item_id}."
+        db.cache.invalidate("items", item_id)
         return f"Item with ID {item_id} was removed from character with ID {character_id}."
     except Exception as e:
-        log(f"remove_item_from_characters_equipment was called, but an exception {e} occurred")
+        log("remove_item_from_characters_equipment was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
+        return f"DB Error: {e}"
+
+@game_tool(max_queries=batch_operations.MAX_OPERATIONS)
+async def batch(operations: list[dict], output_format: str = "", ctx: Context = None) -> str:
+    """
+    Run many game operations in one call and one transaction - either all of them are saved, or none.
+    Use it when several lookups or updates are needed at once, e.g. updating hitpoints and assigning loot after a fight.
+    operations: ordered list of {"tool": <tool name>, "args": {<the tool's arguments>}}. Supported tools: query_playable_characters (by_id),
+    update_character_hitpoints, get_enemy_info_by_id, update_enemy_hitpoints, delete_dead_enemies_from_db, get_item_by_id,
+    assign_item_to_character_equipment, remove_item_from_characters_equipment, get_characters_equipment, get_loot_items_from_enemy
+    output_format: 'prose', 'compact' or 'json' (optional, leave empty for the server's default)
+    """
+    try:
+        db = await get_db(ctx)
+        output_format = get_output_format(output_format)
+        log("batch was called with %s operations: %s", len(operations), operations)
+        validated = batch_operations.validate_operations(operations)
+        results = await db.transaction(lambda connection: batch_operations.run_batch(connection, validated))
+        for table, id in batch_operations.invalidations(validated):
+            db.cache.invalidate(table, id)
+
+        sections = []
+        for index, ((tool, args), result) in enumerate(zip(validated, results), start=1):
+            if isinstance(result, str):
+                sections.append((f"[{index}] {tool}", [{"result": result}], ("result",)))
+            else:
+                sections.append((f"[{index}] {tool}", result, batch_operations.OPERATIONS[tool][1]))
+        if output_format != "prose":
+            return render_sections(sections, output_format)
+
+        response = f"All {len(validated)} operations were run and saved.\n"
+        for label, rows, columns in sections:
+            if not rows:
+                response += f"{label}: nothing found.\n"
+            elif columns == ("result",):
+                response += f"{label}: {rows[0]['result']}\n"
+                continue
+            for row in rows:
+                response += f"{label}: " + ", ".join(f"{column}: {row[column]}" for column in columns) + "\n"
+        return response
+    except ValueError as e:
+        log("batch was called with invalid operations: %s", e)
+        return f"Invalid operations, nothing was run. {e}"
+    except batch_operations.BatchError as e:
+        log("batch was called, but an operation failed: %s", e)
+        return f"Batch rolled back, nothing was saved. {e}"
+    except Exception as e:
+        log("batch was called, but an exception %s occurred", e, level=logging.ERROR, error=str(e))
         return f"DB Error: {e}"
 
+# Static world data published as MCP resources: uri -> (table, key, columns). Every resource carries a version (a content hash),
+# and world://versions lists the versions of all of them, so clients can cache the resources and re-read only the changed ones
+WORLD_RESOURCES = {
+    "world://locations": ("location", "locations", LOCATION_COLUMNS),
+    "world://items": ("items", "items", CATALOG_ITEM_COLUMNS),
+}
+# The resources are paged like the "all" queries: world://items is the first page, world://items/{cursor} the next ones
+RESOURCE_PAGE_SIZE = MAX_PAGE_SIZE
+world_versions_cache = weakref.WeakKeyDictionary() # world -> {uri: (the table's cache generation, version)}
+
+def resource_version(connection, table, columns) -> str:
+    # A hash of the whole resource, streamed in chunks, so the big worlds' catalogs are never held in memory at once
+    digest = hashlib.sha256()
+    cursor = connection.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+    while rows := cursor.fetchmany(1000):
+        digest.update(json.dumps([list(row) for row in rows], separators=(",", ":")).encode())
+    return digest.hexdigest()[:16]
+
+async def world_resource_version(world: Database, uri) -> str:
+    table, _, columns = WORLD_RESOURCES[uri]
+    await world.sync_cache()
+    generation = world.cache.generation(table)
+    versions = world_versions_cache.setdefault(world, {})
+    cached = versions.get(uri)
+    if cached and cached[0] == generation:
+        return cached[1]
+    version = await world.read_with(functools.partial(resource_version, table=table, columns=columns))
+    versions[uri] = (generation, version)
+    return version
+
+async def get_world_resource(uri, cursor=-1) -> dict:
+    """A page of the resource, of the world of the session that reads it"""
+    table, key, columns = WORLD_RESOURCES[uri]
+    async with session_world(mcp_app.get_context()) as world:
+        version = await world_resource_version(world, uri)
+        rows, total, next_cursor = await read_page(world, table, cursor, RESOURCE_PAGE_SIZE)
+    return {"version": version, key: [{column: row[column] for column in columns} for row in rows], "total": total, "next_cursor": next_cursor}
+
+@mcp_app.resource("world://versions", mime_type="application/json")
+async def world_versions() -> str:
+    """Versions of the world resources - re-read a resource only when its version changed"""
+    async with session_world(mcp_app.get_context()) as world:
+        return json.dumps({uri: await world_resource_version(world, uri) for uri in WORLD_RESOURCES})
+
+@mcp_app.resource("world://locations", mime_type="application/json")
+async def world_locations() -> str:
+    """The first page of the locations of the world (id, name, description), with the total and the next page's cursor"""
+    return json.dumps(await get_world_resource("world://locations"), separators=(",", ":"))
+
+@mcp_app.resource("world://locations/{cursor}", mime_type="application/json")
+async def world_locations_page(cursor: str) -> str:
+    """The page of the locations after the cursor (the last id of the previous page)"""
+    return json.dumps(await get_world_resource("world://locations", int(cursor)), separators=(",", ":"))
+
+@mcp_app.resource("world://items", mime_type="application/json")
+async def world_items() -> str:
+    """
+    The first page of the item catalog (id, name, type, description, hitpoint impact, rarity), with the total and the next
+    page's cursor - the items' owners change, so they are not included
+    """
+    return json.dumps(await get_world_resource("world://items"), separators=(",", ":"))
+
+@mcp_app.resource("world://items/{cursor}", mime_type="application/json")
+async def world_items_page(cursor: str) -> str:
+    """The page of the item catalog after the cursor (the last id of the previous page)"""
+    return json.dumps(await get_world_resource("world://items", int(cursor)), separators=(",", ":"))
+
+@mcp_app.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> PlainTextResponse:
+    """Prometheus metrics: per-tool calls, errors, latency and in flight calls, SQLite query and commit time, rows read, row cache"""
+    databases = [db] + (list(worlds.worlds.values()) if worlds else [])
+    ROW_CACHE_ROWS.set(sum(database.cache.stats()["size"] for database in databases))
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @mcp_app.prompt()
 def get_initial_prompts() -> list[base.Message]:
     return [
         base.AssistantMessage(initial_prompt)
     ]
 
-if __name__ == "__main__":
+# The worker processes (--workers) get the launch options of the main process (with their own port and worker_index) in this environment variable
+WORKER_ARGS_VARIABLE = "RPG_SERVER_WORKER_ARGS"
+
+def configure(args):
+    """Applies the launch options to this process - the only one, or one of the workers"""
+    global db, worlds, g_output_format
+
+    log_level = args.log_level or ("INFO" if args.verbose else "WARNING")
+    log_file = args.log_file
+    worker_index = getattr(args, "worker_index", None)
+    if log_file and worker_index is not None:
+        # The rotation of one file by many processes would lose lines, so every worker writes its own file
+        root, ext = os.path.splitext(log_file)
+        log_file = f"{root}.{worker_index}{ext}"
+    setup_logging(logger, log_level, log_file=log_file, max_bytes=args.log_max_bytes, backups=args.log_backups)
+    tool_call_sampler.rate = args.log_sample_rate
+
+    g_output_format = args.output_format
+
+    if args.combat_seed is not None:
+        combat_rng.seed(args.combat_seed)
+
+    db = Database(db_name=args.db_file)
+
+    if args.soft_restart_db:
+        log("Will soft restart the datbase for fresh, identical start of the adventure")
+        db.soft_restart_db() # Resets database entries for fresh, identical start of the adventure
+
+    if args.generate_world:
+        rows = generate_world(db, args.world_seed, **world_counts(args.generate_world))
+        log("Generated a world of %s rows with the seed %s", rows, args.world_seed)
+
+    if args.import_world:
+        counts = import_world(db.connection, args.import_world)
+        db.cache.clear()
+        log("Imported the world from %s", args.import_world, **counts)
+
+    db.cache.max_size = args.cache_size
+
+    if args.workers > 1:
+        # The workers coordinate their writes through SQLite
+        db.enable_shared_access()
+
+    if args.pooled_db:
+        log("Using the pooled database with %s read connections", args.read_connections)
+        db.enable_pooling(args.read_connections, args.commit_latency_ms / 1000, args.commit_batch_size)
+
+    if args.per_session_worlds:
+        log("Every session gets its own world, at most %s worlds are kept open", args.max_worlds)
+        # The sessions of a worker (and so their worlds) are only its own
+        worlds_dir = args.worlds_dir if worker_index is None else os.path.join(args.worlds_dir, f"worker-{worker_index}")
+        worlds = WorldManager(db.build_template(), worlds_dir, args.max_worlds, args.cache_size, world_ttl=args.world_ttl)
+
+def run_workers(args):
+    """
+    --workers: starts the worker processes, each a whole server on its own local port, and serves them through
+    the SessionRouter, which sends all the requests of an MCP session to the worker that created it
+    """
+    ports = [free_port() for _ in range(args.workers)]
+    processes = []
+    try:
+        for index, port in enumerate(ports):
+            worker_args = json.dumps(dict(vars(args), host="127.0.0.1", port=port, worker_index=index))
+            processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=dict(os.environ, **{WORKER_ARGS_VARIABLE: worker_args})))
+        for port in ports:
+            wait_for_port(port)
+        router = SessionRouter([f"http://127.0.0.1:{port}" for port in ports])
+        # uvicorn re-raises the stop signal once it's done, this makes SIGTERM exit through the finally below too (like SIGINT)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        uvicorn.run(router.app(), host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+if __name__ == "__main__" and os.getenv(WORKER_ARGS_VARIABLE):
+    # A worker process of --workers, started by run_workers
+    args = argparse.Namespace(**json.loads(os.environ[WORKER_ARGS_VARIABLE]))
+    configure(args)
+    uvicorn.run(mcp_app.streamable_http_app(), host=args.host, port=args.port)
+elif __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--host', default='0.0.0.0', help='Bind Host')
     parser.add_argument('--port', type=int, default=8080, help='Bind Port')
-    parser.add_argument('--verbose', action = 'store_true', default = False, help = 'Enable stdout logging')
+    parser.add_argument('--workers', type=int, default=1, help='Number of server processes sharing the database file, behind a router that keeps every MCP session on its worker')
+    parser.add_argument('--db_file', default=DEFAULT_DB_FILE, help='Path to the database file')
+    parser.add_argument('--verbose', action = 'store_true', default = False, help = 'Enable stdout logging (the INFO level)')
+    parser.add_argument('--log_level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default=None, help='Log level, DEBUG adds a tool_call event per tool call (default WARNING, INFO with --verbose)')
+    parser.add_argument('--log_file', default=None, help='Also write the JSON log lines to this file, rotated by size')
+    parser.add_argument('--log_max_bytes', type=int, default=10 * 1024 * 1024, help='Size of the log file that triggers the rotation (with --log_file)')
+    parser.add_argument('--log_backups', type=int, default=5, help='Number of the rotated log files kept (with --log_file)')
+    parser.add_argument('--log_sample_rate', type=float, default=1.0, help='Rate (0.0 - 1.0) of the logged tool_call events')
     parser.add_argument('--soft_restart_db', action = 'store_true', default = False, help = 'Resets database entries for fresh, identical start of the adventure')
+    parser.add_argument('--generate_world', type=int, default=0, metavar='ROWS', help='Replaces the world with a generated one of about ROWS rows (see worldgen.py)')
+    parser.add_argument('--world_seed', type=int, default=0, help='Seed of the generated world (with --generate_world)')
+    parser.add_argument('--import_world', default=None, metavar='PATH', help='Replaces the world with a campaign - a .jsonl file or a directory of CSV files (see world_io.py)')
+    parser.add_argument('--output_format', choices=OUTPUT_FORMATS, default='prose', help='Default format of the tools\' responses, compact and json use fewer tokens than prose')
+    parser.add_argument('--combat_seed', type=int, default=None, help='Seed of the damage rolls of resolve_attack, for reproducible fights')
+    parser.add_argument('--per_session_worlds', action = 'store_true', default = False, help = 'Every MCP session plays in its own world, cloned from the template database')
+    parser.add_argument('--max_worlds', type=int, default=100, help='Max number of open worlds, the least recently used ones are closed and reopened on their next call (with --per_session_worlds)')
+    parser.add_argument('--world_ttl', type=float, default=3600.0, help='Seconds after the last call when a world is deleted, 0 keeps them until the server stops (with --per_session_worlds)')
+    parser.add_argument('--worlds_dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "worlds"), help='Directory for the worlds of the sessions (with --per_session_worlds)')
+    parser.add_argument('--cache_size', type=int, default=1024, help='Max number of cached rows of the static world content (per world), 0 disables the cache')
+    parser.add_argument('--pooled_db', action = argparse.BooleanOptionalAction, default = True, help = 'WAL journal, pool of read connections and a single group committing writer, so the reads don\'t queue behind a slow statement (on by default, --no-pooled_db runs everything on one DB thread)')
+    parser.add_argument('--read_connections', type=int, default=4, help='Number of read-only connections (with --pooled_db)')
+    parser.add_argument('--commit_latency_ms', type=float, default=0.0, help='Max time a write waits to be committed together with others (with --pooled_db)')
+    parser.add_argument('--commit_batch_size', type=int, default=64, help='Max number of writes committed together (with --pooled_db)')
     args = parser.parse_args()
 
-    if args.verbose:
-        g_verbose = args.verbose
-
-    if args.soft_restart_db:
-        log(f"Will soft restart the datbase for fresh, identical start of the adventure")
-        db.soft_restart_db() # Resets database entries for fresh, identical start of the adventure
+    if (args.generate_world or args.import_world) and args.per_session_worlds:
+        parser.error("--per_session_worlds clones the template database, the generated or imported world would not be used")
 
-    http_app = mcp_app.streamable_http_app()
-    uvicorn.run(http_app, host=args.host, port=args.port)
+    if args.workers > 1:
+        # The database file is reset and switched to WAL once, by the main process, before the workers open it
+        main_db = Database(db_name=args.db_file)
+        if args.soft_restart_db:
+            main_db.soft_restart_db()
+            args.soft_restart_db = False
+        if args.generate_world:
+            generate_world(main_db, args.world_seed, **world_counts(args.generate_world))
+            args.generate_world = 0
+        if args.import_world:
+            import_world(main_db.connection, args.import_world)
+            args.import_world = None
+        if args.per_session_worlds:
+            # Built once here, so the workers don't race to build the same template file
+            main_db.build_template()
+        main_db.enable_shared_access()
+        main_db.close()
+        run_workers(args)
+    else:
+        configure(args)
+        http_app = mcp_app.streamable_http_app()
+        uvicorn.run(http_app, host=args.host, port=args.port)
@@ -0,0 +1,58 @@
+import sys
+import json
+import queue
+import random
+import atexit
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Non-blocking structured logging: the logging calls only put the record on a queue, a background thread (QueueListener)
+# formats the JSON lines and writes them to stdout and/or a rotating log file, so the logging doesn't slow down the tools
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the record's structured fields"""
+    def format(self, record) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+
+class Sampler:
+    """Lets through a rate (0.0 - 1.0) of the high-volume events, checked before the record is even created"""
+    def __init__(self, rate=1.0):
+        self.rate = rate
+        self.random = random.Random()
+
+    def __call__(self) -> bool:
+        return self.rate >= 1.0 or self.random.random() < self.rate
+
+
+def setup_logging(logger, level=logging.WARNING, console=True, log_file=None, max_bytes=10 * 1024 * 1024, backups=5) -> QueueListener:
+    """
+    Routes the logger's records through a queue to the background writer thread. The writer is stopped, and the queue
+    flushed, at exit. Returns the started QueueListener.
+    """
+    handlers = []
+    if console:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    if log_file:
+        handlers.append(RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    logger.setLevel(level)
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,152 @@
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+
+# TERMINAL
+# For instance: python.exe world_io.py import campaigns/default.jsonl --db_file my_world.db
+#               python.exe world_io.py export my_campaign/ --db_file my_world.db
+# Streams the world content in and out of the database - a JSONL file (one {"table": ..., column: value, ...} object per
+# line) or a directory with one CSV file per table (<table>.csv with a header line). Both directions work in fixed size
+# chunks, so the memory use doesn't grow with the size of the campaign.
+
+CHUNK_SIZE = 10000
+
+# The world tables and their columns, parents before children
+TABLE_COLUMNS = {
+    "location": ("id", "name", "description"),
+    "characters": ("id", "name", "class", "race", "hitpoints"),
+    "items": ("id", "owner_id", "name", "type", "functional_descr", "hitpoint_impact", "rarity"),
+    "enemies": ("id", "name", "description", "hitpoints", "base_damage", "spawn_location"),
+    "loot": ("enemy_id", "item_id"),
+    "npc": ("id", "name", "description", "information_to_give", "quest_to_give", "spawn_location", "reward_id"),
+}
+
+class WorldImportError(Exception):
+    """The campaign can't be imported (unknown table, broken foreign keys...), nothing was changed"""
+    pass
+
+def insert_query(table) -> str:
+    columns = TABLE_COLUMNS[table]
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+def read_jsonl(path):
+    # (table, row tuple) of every line
+    with open(path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            entity = json.loads(line)
+            table = entity.get("table")
+            if table not in TABLE_COLUMNS:
+                raise WorldImportError(f"{path}:{line_number}: unknown table {table!r}")
+            yield table, tuple(entity.get(column) for column in TABLE_COLUMNS[table])
+
+def read_csv_directory(directory):
+    # (table, row tuple) of every line of the <table>.csv files - the empty values are NULLs
+    for table, columns in TABLE_COLUMNS.items():
+        path = os.path.join(directory, f"{table}.csv")
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            for row in csv.DictReader(file):
+                yield table, tuple(row.get(column) or None for column in columns)
+
+def import_world(connection, path, chunk_size=CHUNK_SIZE) -> dict:
+    """
+    Replaces the world content with the campaign's (a JSONL file or a directory of CSV files), in one transaction.
+    The foreign keys are checked once, at the end, so the rows can come in any order. Returns the rows per table.
+    """
+    rows = read_csv_directory(path) if os.path.isdir(path) else read_jsonl(path)
+    buffers = {table: [] for table in TABLE_COLUMNS}
+    counts = {table: 0 for table in TABLE_COLUMNS}
+
+    def flush(table):
+        connection.executemany(insert_query(table), buffers[table])
+        counts[table] += len(buffers[table])
+        buffers[table].clear()
+
+    try:
+        connection.execute("BEGIN")
+        connection.execute("PRAGMA defer_foreign_keys = ON")
+        for table in reversed(TABLE_COLUMNS):
+            connection.execute(f"DELETE FROM {table}")
+        for table, row in rows:
+            buffers[table].append(row)
+            if len(buffers[table]) >= chunk_size:
+                flush(table)
+        for table in TABLE_COLUMNS:
+            flush(table)
+
+        violations = connection.execute("PRAGMA foreign_key_check").fetchmany(5)
+        if violations:
+            details = ", ".join(f"{table} row {rowid} -> {parent}" for table, rowid, parent, _ in violations)
+            raise WorldImportError(f"The campaign breaks foreign keys: {details}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return counts
+
+def table_chunks(connection, chunk_size):
+    # (table, columns, rows) chunks of every table, in the storage order
+    for table, columns in TABLE_COLUMNS.items():
+        cursor = connection.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid")
+        yield table, columns, []
+        while chunk := cursor.fetchmany(chunk_size):
+            yield table, columns, chunk
+
+def export_world(connection, path, chunk_size=CHUNK_SIZE) -> dict:
+    """Streams the world content out to a JSONL file (path ending with .jsonl) or a directory of CSV files. Returns the rows per table."""
+    counts = {table: 0 for table in TABLE_COLUMNS}
+    if path.endswith(".jsonl"):
+        with open(path, "w", encoding="utf-8") as file:
+            for table, columns, chunk in table_chunks(connection, chunk_size):
+                file.writelines(json.dumps({"table": table, **dict(zip(columns, row))}, ensure_ascii=False) + "\n" for row in chunk)
+                counts[table] += len(chunk)
+        return counts
+
+    os.makedirs(path, exist_ok=True)
+    file = None
+    try:
+        for table, columns, chunk in table_chunks(connection, chunk_size):
+            if not chunk:
+                # The first (empty) chunk of a table starts its file
+                if file:
+                    file.close()
+                file = open(os.path.join(path, f"{table}.csv"), "w", encoding="utf-8", newline="")
+                writer = csv.writer(file)
+                writer.writerow(columns)
+            writer.writerows(chunk)
+            counts[table] += len(chunk)
+    finally:
+        if file:
+            file.close()
+    return counts
+
+if __name__ == "__main__":
+    from database import Database
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['import', 'export'], help='import replaces the world content with the campaign, export writes it out')
+    parser.add_argument('path', help='A .jsonl file, or a directory of <table>.csv files')
+    parser.add_argument('--db_file', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "rpg_database.db"), help='Path to the database file')
+    parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE, help='Rows read or written at once')
+    args = parser.parse_args()
+
+    world = Database(db_name=args.db_file)
+    start = time.perf_counter()
+    try:
+        if args.command == "import":
+            counts = import_world(world.connection, args.path, args.chunk_size)
+        else:
+            counts = export_world(world.connection, args.path, args.chunk_size)
+    except WorldImportError as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        world.close()
+    print(f"{args.command.capitalize()}ed {sum(counts.values())} rows ({', '.join(f'{count} {table}' for table, count in counts.items())}) "
+          f"in {time.perf_counter() - start:.1f} s")
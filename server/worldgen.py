@@ -0,0 +1,170 @@
+import time
+import random
+import argparse
+import itertools
+
+from database import Database
+from world_io import TABLE_COLUMNS
+
+# TERMINAL
+# For instance: python.exe worldgen.py --db_file big_world.db --rows 1000000 --seed 7
+# Seeded procedural worlds of any size - the fixture of the benchmarks and load tests. The same seed and counts always
+# give the same world. The rows are generated and inserted in chunks, so the memory use doesn't grow with the world.
+
+CHUNK_SIZE = 20000
+
+LOCATION_ADJECTIVES = ["Misty", "Frozen", "Burning", "Silent", "Crooked", "Golden", "Sunken", "Whispering", "Ashen", "Verdant", "Howling", "Forgotten"]
+LOCATION_NOUNS = ["Hollow", "Marsh", "Peaks", "Village", "Crossroads", "Catacombs", "Forest", "Ruins", "Harbor", "Mines", "Keep", "Glade"]
+LOCATION_DETAILS = ["Narrow paths wind between old stones.", "The air smells of smoke and rain.", "Travelers rarely stay here for long.",
+                    "Old banners still hang on the walls.", "Strange tracks cover the ground.", "A cold wind never stops blowing."]
+
+CHARACTER_NAMES = ["Aldric", "Brina", "Cedric", "Dara", "Eldon", "Fiora", "Garrick", "Helka", "Ivor", "Jessa", "Korin", "Lyra"]
+CHARACTER_CLASSES = ["Warrior", "Mage", "Rogue", "Ranger", "Cleric", "Paladin"]
+CHARACTER_RACES = ["Human", "Elf", "Dwarf", "Halfling", "Orc"]
+
+# (type, min hitpoint impact, max hitpoint impact, weight) - the healing potions and plain weapons are the most common
+ITEM_TYPES = [
+    ("Single Handed Melee Weapon", 8, 20, 20),
+    ("Two Handed Melee Weapon", 15, 30, 10),
+    ("Ranged Weapon", 10, 22, 10),
+    ("Magic Weapon", 12, 28, 6),
+    ("Armor", 2, 10, 14),
+    ("Shield", 1, 6, 8),
+    ("Healing Item", 10, 40, 30),
+    ("Quest Item", 0, 0, 2),
+]
+ITEM_MATERIALS = ["Rusty", "Iron", "Steel", "Elven", "Dwarven", "Runed", "Ancient"]
+RARITY_WEIGHTS = [50, 25, 15, 7, 3] # Rarity 1 (common) to 5 (legendary)
+
+# (name, min hitpoints, max hitpoints, min damage, max damage, weight)
+ENEMY_ARCHETYPES = [
+    ("Giant Rat", 5, 15, 1, 4, 25),
+    ("Wolf", 15, 30, 4, 8, 20),
+    ("Goblin", 20, 35, 5, 10, 20),
+    ("Bandit", 30, 50, 6, 12, 15),
+    ("Skeleton", 25, 45, 5, 11, 10),
+    ("Troll", 80, 140, 12, 22, 6),
+    ("Wyvern", 150, 250, 20, 35, 3),
+    ("Lich", 250, 400, 30, 50, 1),
+]
+LOOT_COUNT_WEIGHTS = [30, 40, 20, 10] # Loot items of an enemy, 0 to 3
+
+def world_counts(rows) -> dict:
+    """Entity counts of a world of about the given number of rows (the loot links included)"""
+    return {
+        "locations": max(5, rows // 100),
+        "characters": max(3, rows * 3 // 100),
+        "items": max(20, rows * 31 // 100),
+        "enemies": max(10, rows * 29 // 100),
+        "npcs": max(5, rows * 3 // 100),
+    }
+
+def skewed_index(rng, count) -> int:
+    # Squaring the uniform value crowds the rows towards the low ids - a few busy locations, many quiet ones
+    return int(count * rng.random() ** 2)
+
+def insert_chunked(connection, query, rows):
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, CHUNK_SIZE)):
+        connection.executemany(query, chunk)
+
+def generate_locations(rng, count):
+    for id in range(count):
+        name = f"{rng.choice(LOCATION_ADJECTIVES)} {rng.choice(LOCATION_NOUNS)}"
+        yield id, name, f"{name}. {rng.choice(LOCATION_DETAILS)}"
+
+def generate_characters(rng, count):
+    for id in range(count):
+        yield id, rng.choice(CHARACTER_NAMES), rng.choice(CHARACTER_CLASSES), rng.choice(CHARACTER_RACES), rng.randint(60, 140)
+
+def generate_items(rng, count, characters):
+    types = rng.choices(ITEM_TYPES, weights=[item_type[3] for item_type in ITEM_TYPES], k=count)
+    rarities = rng.choices(range(1, 6), weights=RARITY_WEIGHTS, k=count)
+    for id, (item_type, low, high, _), rarity in zip(range(count), types, rarities):
+        # 10% of the items are already owned by somebody
+        owner_id = rng.randrange(characters) if rng.random() < 0.1 else None
+        impact = rng.randint(low, high) * (3 + rarity) // 4
+        yield (id, owner_id, f"{rng.choice(ITEM_MATERIALS)} {item_type}", item_type,
+               f"A {item_type.lower()} of rarity {rarity}.", impact, rarity)
+
+def generate_enemies(rng, count, locations):
+    archetypes = rng.choices(ENEMY_ARCHETYPES, weights=[archetype[5] for archetype in ENEMY_ARCHETYPES], k=count)
+    for id, (name, min_hp, max_hp, min_damage, max_damage, _) in zip(range(count), archetypes):
+        # 5% of the enemies have already been killed, but not cleaned up yet
+        hitpoints = 0 if rng.random() < 0.05 else rng.randint(min_hp, max_hp)
+        yield (id, name, f"A hostile {name.lower()}.", hitpoints, rng.randint(min_damage, max_damage), skewed_index(rng, locations))
+
+def generate_loot(rng, enemies, items):
+    loot_counts = rng.choices(range(len(LOOT_COUNT_WEIGHTS)), weights=LOOT_COUNT_WEIGHTS, k=enemies)
+    for enemy_id, loot_count in enumerate(loot_counts):
+        for item_id in set(rng.randrange(items) for _ in range(loot_count)):
+            yield enemy_id, item_id
+
+def generate_npcs(rng, count, locations, items):
+    for id in range(count):
+        name = rng.choice(CHARACTER_NAMES)
+        # Half of the NPCs give a quest with a reward
+        reward_id = rng.randrange(items) if rng.random() < 0.5 else None
+        quest = "Bring me proof of a slain beast and the reward is yours." if reward_id is not None else None
+        yield (id, name, f"A local called {name}.", f"{name} knows the roads around here.", quest,
+               skewed_index(rng, locations), reward_id)
+
+def generate_world(world: Database, seed=0, locations=100, characters=30, items=310, enemies=290, npcs=30) -> int:
+    """
+    Replaces the world's content with a generated one, in a single transaction. Returns the number of inserted rows.
+    The generated world doesn't go into the template, so soft_restart_db brings the hand made world back.
+    """
+    rng = random.Random(seed)
+    connection = world.connection
+    world.cache.clear()
+
+    tables = [
+        ("INSERT INTO location (id, name, description) VALUES (?, ?, ?)", generate_locations(rng, locations)),
+        ("INSERT INTO characters (id, name, class, race, hitpoints) VALUES (?, ?, ?, ?, ?)", generate_characters(rng, characters)),
+        ("INSERT INTO items (id, owner_id, name, type, functional_descr, hitpoint_impact, rarity) VALUES (?, ?, ?, ?, ?, ?, ?)",
+         generate_items(rng, items, characters)),
+        ("INSERT INTO enemies (id, name, description, hitpoints, base_damage, spawn_location) VALUES (?, ?, ?, ?, ?, ?)",
+         generate_enemies(rng, enemies, locations)),
+        ("INSERT INTO loot (enemy_id, item_id) VALUES (?, ?)", generate_loot(rng, enemies, items)),
+        ("INSERT INTO npc (id, name, description, information_to_give, quest_to_give, spawn_location, reward_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+         generate_npcs(rng, npcs, locations, items)),
+    ]
+
+    # The generated rows are valid by construction, so the per row foreign key checks are skipped, and the indexes
+    # are built once at the end - both make the bulk insert faster
+    indexes = connection.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+    connection.execute("PRAGMA foreign_keys = OFF")
+    try:
+        connection.execute("BEGIN")
+        # The old world is deleted in the same transaction, so a failed generation leaves it as it was
+        for table in reversed(TABLE_COLUMNS):
+            connection.execute(f"DELETE FROM {table}")
+        before = connection.total_changes
+        for name, _ in indexes:
+            connection.execute(f"DROP INDEX {name}")
+        for query, rows in tables:
+            insert_chunked(connection, query, rows)
+        for _, sql in indexes:
+            connection.execute(sql)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.execute("PRAGMA foreign_keys = ON")
+    return connection.total_changes - before
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db_file', required=True, help='Path to the database file, its content is replaced')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the world')
+    parser.add_argument('--rows', type=int, default=1000000, help='Approximate number of rows of the world, split between the tables')
+    args = parser.parse_args()
+
+    counts = world_counts(args.rows)
+    world = Database(db_name=args.db_file)
+    start = time.perf_counter()
+    rows = generate_world(world, args.seed, **counts)
+    print(f"Generated {rows} rows ({', '.join(f'{count} {table}' for table, count in counts.items())}, and loot) "
+          f"in {time.perf_counter() - start:.1f} s")
+    world.close()
@@ -0,0 +1,152 @@
+import os
+import re
+import glob
+import shutil
+import time
+import asyncio
+import contextlib
+from collections import OrderedDict, defaultdict
+
+from database import Database
+
+
+class WorldExpiredError(Exception):
+    """The session's world was deleted after it wasn't used for world_ttl, the player has to start a new game in a new session"""
+    pass
+
+
+class WorldManager:
+    """
+    Gives every MCP session its own world, so concurrent players don't share (and corrupt) one mutable game.
+    A world is a database file cloned lazily from the template database on the session's first tool call.
+    When there are more than max_worlds open, the least recently used idle worlds (with no calls in flight) are closed -
+    their files are kept, and the next call of the session reopens its world where the player left it.
+    A world that wasn't used for world_ttl seconds is deleted, and the further calls of its session get WorldExpiredError
+    instead of a fresh world. Only the last max_expired expired sessions are remembered, an older one gets a fresh world again.
+    """
+    def __init__(self, template_path, directory, max_worlds=100, cache_size=1024, max_expired=10000, world_ttl=3600.0):
+        self.template_path = template_path
+        self.directory = directory
+        self.max_worlds = max_worlds
+        self.cache_size = cache_size
+        self.world_ttl = world_ttl # None or 0 keeps the worlds until the server stops
+        self.worlds = OrderedDict() # session_id -> Database, the open worlds, least recently used first
+        self.last_used = OrderedDict() # session_id -> time.monotonic() of the last call, every world with a file, least recently used first
+        self.in_flight = defaultdict(int) # session_id -> calls using its world right now
+        self.max_expired = max_expired
+        self.expired = OrderedDict() # session_id -> None, the sessions whose worlds were deleted, least recently used first
+        self.lock = asyncio.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Sessions don't survive a server restart, so neither do their worlds
+        for path in glob.glob(os.path.join(self.directory, "world-*.db")):
+            os.remove(path)
+
+    def world_path(self, session_id) -> str:
+        safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", session_id)
+        return os.path.join(self.directory, f"world-{safe_id}.db")
+
+    def _open_world(self, session_id) -> Database:
+        path = self.world_path(session_id)
+        # A closed world is reopened as the player left it, a new one is cloned from the template
+        if not os.path.exists(path):
+            shutil.copyfile(self.template_path, path)
+        return Database(db_name=path, cache_size=self.cache_size)
+
+    def _delete_world(self, session_id, world=None):
+        if world:
+            world.close()
+        path = self.world_path(session_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    @contextlib.asynccontextmanager
+    async def use(self, session_id):
+        """The session's world, which isn't closed until the block ends. Raises WorldExpiredError when it was deleted"""
+        world = await self._acquire(session_id)
+        try:
+            yield world
+        finally:
+            self._release(session_id)
+
+    async def get(self, session_id) -> Database:
+        async with self.use(session_id) as world:
+            return world
+
+    def _claim(self, session_id):
+        self.in_flight[session_id] += 1
+        self.last_used[session_id] = time.monotonic()
+        self.last_used.move_to_end(session_id)
+
+    def _release(self, session_id):
+        self.in_flight[session_id] -= 1
+        if not self.in_flight[session_id]:
+            del self.in_flight[session_id]
+
+    async def _acquire(self, session_id) -> Database:
+        # The world is looked up and its call counted without an await in between, so it can't be closed in between
+        self._check_expired(session_id)
+        world = self.worlds.get(session_id)
+        if world:
+            self.worlds.move_to_end(session_id)
+            self._claim(session_id)
+            await self._delete_expired_worlds()
+            return world
+
+        async with self.lock:
+            # Another call of the same session could have opened (or the world could have expired) while this one waited for the lock
+            self._check_expired(session_id)
+            # Counted before the file is opened, so the world can't expire while it's being opened
+            self._claim(session_id)
+            try:
+                if session_id not in self.worlds:
+                    self.worlds[session_id] = await asyncio.to_thread(self._open_world, session_id)
+            except BaseException:
+                self._release(session_id)
+                raise
+            self.worlds.move_to_end(session_id)
+            await self._close_idle_worlds()
+            await self._delete_expired_worlds()
+            return self.worlds[session_id]
+
+    def _check_expired(self, session_id):
+        if session_id in self.expired:
+            self.expired.move_to_end(session_id)
+            raise WorldExpiredError(f"The world of session {session_id} expired")
+
+    async def _close_idle_worlds(self):
+        # The worlds in use stay open, even if that keeps more than max_worlds open for a while
+        excess = len(self.worlds) - self.max_worlds
+        if excess <= 0:
+            return
+        session_ids = [session_id for session_id in self.worlds if not self.in_flight.get(session_id)][:excess]
+        # All of them are taken out before the first await, so none of them can be handed out in the meantime -
+        # the next call of the session waits for the lock, so it reopens the file only after it was closed
+        closed = [self.worlds.pop(session_id) for session_id in session_ids]
+        for world in closed:
+            await asyncio.to_thread(world.close)
+
+    async def _delete_expired_worlds(self):
+        if not self.world_ttl:
+            return
+        deadline = time.monotonic() - self.world_ttl
+        session_ids = []
+        for session_id, last_used in self.last_used.items():
+            if last_used > deadline:
+                break
+            if not self.in_flight.get(session_id):
+                session_ids.append(session_id)
+        # Taken out before the first await, like in _close_idle_worlds
+        deleted = [(session_id, self.worlds.pop(session_id, None)) for session_id in session_ids]
+        for session_id in session_ids:
+            del self.last_used[session_id]
+            self.expired[session_id] = None
+        while len(self.expired) > self.max_expired:
+            self.expired.popitem(last=False)
+        for session_id, world in deleted:
+            await asyncio.to_thread(self._delete_world, session_id, world)
+
+    def close(self):
+        while self.last_used:
+            session_id, _ = self.last_used.popitem()
+            self._delete_world(session_id, self.worlds.pop(session_id, None))